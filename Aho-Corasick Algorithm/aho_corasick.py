@@ -1,5 +1,14 @@
 import collections   # has a deque for breadth-first-search
+import itertools
 import argparse
+import hashlib  # for cache keys
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+import shutil
+import tempfile
+import numpy as np  # for typed arrays
+from numba import njit, int32, int64, uint8  # for just-in-time compilation
 
 #####################################################
 # Aho-Corasick
@@ -12,6 +21,7 @@ class ACNode():
         self.parent = parent   # parent of this node
         self.letter = letter   # letter between parent and this node
         self.out = []          # output function of this node
+        self.lps_in = None     # nodes whose lps link is this node (built on demand)
         if parent is None:
             self.depth = depth # number of chars from root to this n ode
             self.label = label # string from root to this node
@@ -57,8 +67,12 @@ class ACNode():
         return s
 
 
-def AC_build(P):
-    """build AC autmaton for list of patterns P, return its root node."""
+def AC_build(P, dfa=False):
+    """
+    build AC autmaton for list of patterns P, return its root node.
+    If dfa=True, return the complete goto/failure DFA as an ACTable instead
+    (see AC_table).
+    """
     # Build a root for the trie
     root = ACNode()
     # Build the trie, pattern by pattern
@@ -72,120 +86,1271 @@ def AC_build(P):
                 node.targets[a] = newnode
                 node = newnode
         node.out.append(i)
-    # Walk through trie in BFS-order to build lps
+    # Walk through trie in BFS-order to build lps:
+    # follow the parent's lps chain until a node can be extended by letter
     for node in root.bfs():
         if node.parent is None: continue
-        node.lps = node.parent.lps.delta(node.letter) if node.depth>1 else root
+        lps = node.parent.lps
+        while lps is not None and node.letter not in lps.targets:
+            lps = lps.lps
+        node.lps = lps.targets[node.letter] if lps is not None else root
         node.out.extend(node.lps.out)
+    if dfa:
+        return AC_table(root, P)
     return root
 
 
-def search_with_AC(P, T):
+# Dense representation of the automaton:
+# delta[q, c] is the next state after reading byte c in state q (int32[states, 256]),
+# lps[q] is the lps link of state q (-1 for the root),
+# the outputs of q are outlist[outstart[q]:outstart[q+1]] (pattern indices),
+# lengths[i] is the length of pattern i.
+# State 0 is the root; states are numbered in BFS order.
+ACTable = collections.namedtuple("ACTable", ["delta", "lps", "outstart", "outlist", "lengths"])
+
+
+def _code(a):
+    """byte code of a pattern letter (str of length 1 or int)"""
+    c = a if isinstance(a, int) else ord(a)
+    if not 0 <= c < 256:
+        raise ValueError(f"letter {a!r} is not in the byte alphabet")
+    return c
+
+
+def AC_table(root, P):
+    """
+    Compile the AC automaton with the given root node (built from patterns P)
+    into a complete DFA, returned as an ACTable.
+    Missing transitions are resolved through the lps links once,
+    so that scanning needs exactly one table lookup per text byte.
+    """
+    nodes = list(root.bfs())
+    ids = {node: q for (q, node) in enumerate(nodes)}
+    nstates = len(nodes)
+    delta = np.zeros((nstates, 256), dtype=np.int32)
+    lps = np.full(nstates, -1, dtype=np.int32)
+    outstart = np.zeros(nstates+1, dtype=np.int32)
+    for (q, node) in enumerate(nodes):
+        if node.lps is not None:
+            # BFS order: the row of the lps node is already complete
+            lps[q] = ids[node.lps]
+            delta[q] = delta[lps[q]]
+        for (a, child) in node.targets.items():
+            delta[q, _code(a)] = ids[child]
+        outstart[q+1] = outstart[q] + len(node.out)
+    outlist = np.fromiter(itertools.chain.from_iterable(node.out for node in nodes),
+        dtype=np.int32, count=outstart[-1])
+    lengths = np.array([len(p) if p is not None else 0 for p in P], dtype=np.int32)
+    return ACTable(delta, lps, outstart, outlist, lengths)
+
+
+@njit(locals=dict(k=int64, q=int32, p=int64, c=uint8))
+def ac_scan(delta, outstart, outlist, lengths, text, results, state=0, offset=0):
+    """
+    just-in-time compiled Aho-Corasick scan over a uint8 text
+    that writes (start, stop, pattern_index) triples into the rows
+    of an int64 array 'results' of shape (N, 3)
+    and returns the number of matches and the final state.
+    The scan starts in the given state, and 'offset' is added to all
+    coordinates, so that a long text can be scanned chunk by chunk.
+    """
+    k = 0
+    N = results.shape[0]
+    q = state
+    for p, c in enumerate(text):
+        q = delta[q, c]
+        for j in range(outstart[q], outstart[q+1]):
+            if k < N:
+                i = outlist[j]
+                results[k, 0] = offset + p + 1 - lengths[i]
+                results[k, 1] = offset + p + 1
+                results[k, 2] = i
+            k += 1
+    return k, q
+
+
+def _text_array(T):
+    """view a text (str, bytes, bytearray or uint8 array) as a numpy uint8 array"""
+    if isinstance(T, np.ndarray):
+        return T
+    if isinstance(T, str):
+        T = T.encode("latin-1")
+    return np.frombuffer(T, dtype=np.uint8)
+
+
+def _ac_scan_any(table, text, results, state=0, offset=0):
+    """run the scan kernel that fits the automaton representation"""
+    if isinstance(table, ACTrie):
+        return ac_scan_compact(*table, text, results, state, offset)
+    return ac_scan(table.delta, table.outstart, table.outlist, table.lengths,
+        text, results, state, offset)
+
+
+def scan_with_AC(table, T, nresults=1 << 16, mode="full"):
+    """
+    Scan text T with a compiled ACTable or ACTrie;
+    yield each triple (start, stop, pattern_index).
+    The reporting mode is one of MODES (see there).
+    If there are more than nresults matches, the text is scanned a second time
+    with a results buffer of the exact size.
+    """
+    yield from stream_with_AC(table, [T], nresults=nresults, mode=mode)
+
+
+def stream_with_AC(table, chunks, nresults=1 << 16, mode="full"):
+    """
+    Scan a text given as an iterable of chunks (bytes, str or uint8 arrays)
+    with a compiled ACTable or ACTrie, carrying the automaton state
+    from one chunk to the next; yield each triple (start, stop, pattern_index)
+    in global text coordinates, including matches that span chunk boundaries.
+    Memory use is independent of the text length,
+    except in "leftmost" mode, which joins the chunks.
+    """
+    def pieces():
+        offset = 0
+        for chunk in chunks:
+            text = _text_array(chunk)
+            yield (None, offset, text)
+            offset += text.size
+
+    for found in _scan_pieces(table, pieces(), nresults, mode):
+        yield found if mode == "count" else found[1:]
+
+
+def _scan_pieces(table, pieces, nresults=1 << 16, mode="full"):
+    """
+    internal generator that scans (header, offset, chunk) pieces
+    and yields (header, start, stop, pattern_index);
+    the automaton restarts at the root whenever a piece has offset 0.
+    In "count" mode, yield (pattern_index, count) over all pieces at the end.
+    If a piece has more than nresults matches, it is scanned a second time
+    with a results buffer of the exact size.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown reporting mode {mode!r}, use one of {MODES}")
+    if mode == "count":
+        yield from _count_pieces(table, pieces)
+        return
+    if mode == "leftmost":
+        pieces = _join_records(pieces)
+    results = np.empty((nresults, 3), dtype=np.int64)
+    q = 0
+    done = False  # "first" mode: the current record has been reported
+    for (header, offset, chunk) in pieces:
+        if offset == 0:
+            q, done = 0, False
+        if done:
+            continue
+        text = _text_array(chunk)
+        if mode == "first":
+            p, q = _ac_first_any(table, text, q)
+            if p >= 0:
+                yield (header, *_ac_first_match(table, q, offset + p + 1))
+                done = True
+            continue
+        if mode == "leftmost":
+            kernel = _ac_leftmost_any
+        else:
+            kernel = _ac_scan_any
+        k, qnext = kernel(table, text, results, q, offset)
+        if k > results.shape[0]:
+            results = np.empty((k, 3), dtype=np.int64)
+            k, qnext = kernel(table, text, results, q, offset)
+        for found in results[:k].tolist():
+            yield (header, *found)
+        q = qnext
+
+
+def _fasta_chunks_from_filelike(f, chunksize=1 << 20, COMMENT=b';'[0], HEADER=b'>'[0]):
+    """
+    internal function that yields fasta records in pieces as
+    (header: bytes, offset: int, chunk: bytearray) with chunks of about chunksize bytes;
+    offset is the position of the chunk in its record, so offset 0 starts a new record.
+    """
+    strip = bytes.strip
+    header = None
+    seq, offset = bytearray(), 0
+    for line in f:
+        line = strip(line)
+        if len(line) == 0:
+            continue
+        if line[0] == COMMENT:
+            continue
+        if line[0] == HEADER:
+            if header is not None:
+                yield (header, offset, seq)
+            header = line[1:]
+            seq, offset = bytearray(), 0
+            continue
+        seq.extend(line)
+        if len(seq) >= chunksize:
+            yield (header, offset, seq)
+            seq, offset = bytearray(), offset + len(seq)
+    if header is not None:
+        yield (header, offset, seq)
+
+
+# binary genome cache:
+# FILE.seq holds the sequences of all records of FILE back to back,
+# FILE.idx.npz holds the record offsets into FILE.seq, the headers,
+# and the size and modification time of FILE when the cache was made.
+
+def genome_cache_names(filename):
+    """names of the sequence and index files of the binary cache of a FASTA file"""
+    return filename + ".seq", filename + ".idx.npz"
+
+
+def _fasta_stamp(filename):
+    st = os.stat(filename)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def make_genome_cache(filename):
+    """
+    Convert a FASTA file into its binary cache, one chunk at a time.
+    Return the names of the sequence and index files.
+    """
+    seqname, idxname = genome_cache_names(filename)
+    headers, offsets = [], [0]
+    with open(filename, "rb") as f, open(seqname + ".tmp", "wb") as fseq:
+        for (header, offset, chunk) in _fasta_chunks_from_filelike(f):
+            if offset == 0:
+                headers.append(header)
+                offsets.append(offsets[-1])
+            fseq.write(chunk)
+            offsets[-1] += len(chunk)
+    with open(idxname + ".tmp", "wb") as fidx:  # np.savez would append .npz to a name
+        np.savez(fidx, offsets=np.array(offsets, dtype=np.int64),
+            headers=np.frombuffer(b"\n".join(headers), dtype=np.uint8),
+            stamp=_fasta_stamp(filename))
+    os.replace(seqname + ".tmp", seqname)
+    os.replace(idxname + ".tmp", idxname)
+    return seqname, idxname
+
+
+def load_genome_cache(filename):
+    """
+    Return (headers, offsets, seq) from the binary cache of a FASTA file,
+    or None if there is no up-to-date cache.
+    seq is a read-only memory map of all sequences (shared by all processes
+    through the page cache); record i is seq[offsets[i]:offsets[i+1]].
+    """
+    seqname, idxname = genome_cache_names(filename)
+    try:
+        with np.load(idxname) as idx:
+            offsets, headers, stamp = idx["offsets"], idx["headers"], idx["stamp"]
+        if not np.array_equal(stamp, _fasta_stamp(filename)):
+            return None
+        if os.path.getsize(seqname) != offsets[-1]:
+            return None
+    except (OSError, KeyError, ValueError):
+        return None
+    headers = headers.tobytes().split(b"\n") if len(offsets) > 1 else []
+    if offsets[-1] == 0:  # an empty file cannot be mapped
+        seq = np.zeros(0, dtype=np.uint8)
+    else:
+        seq = np.asarray(np.memmap(seqname, dtype=np.uint8, mode="r"))
+    return headers, offsets, seq
+
+
+def _fasta_chunks(f, chunksize=1 << 20):
+    """
+    like _fasta_chunks_from_filelike, but if f is an opened FASTA file
+    with an up-to-date binary cache, yield views into the cache instead
+    """
+    cache = load_genome_cache(f.name) if isinstance(getattr(f, "name", None), str) else None
+    if cache is None:
+        yield from _fasta_chunks_from_filelike(f, chunksize)
+        return
+    headers, offsets, seq = cache
+    for (i, header) in enumerate(headers):
+        start, stop = int(offsets[i]), int(offsets[i+1])
+        yield (header, 0, seq[start:min(start + chunksize, stop)])
+        for offset in range(chunksize, stop - start, chunksize):
+            yield (header, offset, seq[start + offset:min(start + offset + chunksize, stop)])
+
+
+def scan_fasta_with_AC(table, f, chunksize=1 << 20, mode="full"):
+    """
+    Scan each record of a FASTA file-like object (opened in binary mode)
+    chunk by chunk; yield (header, start, stop, pattern_index) with coordinates
+    relative to the record. Memory use is independent of the record lengths
+    (except in "leftmost" mode). In "first" mode, report the first match of
+    each record; in "count" mode, yield (pattern_index, count) over all records.
+    """
+    yield from _scan_pieces(table, _fasta_chunks(f, chunksize), mode=mode)
+
+
+def search_with_AC(P, T, compact=False, mode="full"):
     """
     INPUT:
     - List of Patterns P
     - Text T
+    - compact: use the array-backed ACTrie instead of the dense DFA
+    - mode: reporting mode, one of MODES
     OUTPUT:
-    - yield each triple (start, stop, pattern_index)
-    """
-
-    root = AC_build(P)
-
-    # TODO: Implement the pattern search using Aho-Corasick-Algorithm.
-    # The Trie is built in AC_build.
-    for i in range(len(T)): # looping through each character from given text
-      # if the character is leading to the next node
-      # then move the node to that node
-      if T[i] in root.targets:
-        root = root.delta(T[i]) 
-      # if the character is not leading to the next node then there are several options
-      else:       
-        #this option is when it is not leading back to the root, instead finding the longest matching suffix
-        if root.lps is not None: 
-            if root.lps.label != "":
-              root = root.lps
+    - yield each triple (start, stop, pattern_index);
+      in "count" mode, yield (pattern_index, count) for each pattern that occurs
+    """
+    table = AC_build_compact(P) if compact else AC_build(P, dfa=True)
+    yield from scan_with_AC(table, T, mode=mode)
+
+
+#####################################################
+# Incremental updates
+
+def _index_lps(root):
+    """build the inverse lps links (lps_in) of all nodes, if not done yet"""
+    if root.lps_in is not None:
+        return
+    for node in root.bfs():
+        node.lps_in = []
+    for node in root.bfs():
+        if node.lps is not None:
+            node.lps.lps_in.append(node)
+
+
+def _lps_subtree(node):
+    """yield the nodes whose lps chain contains node, parents before children"""
+    Q = collections.deque(node.lps_in)
+    while len(Q) > 0:
+        u = Q.popleft()
+        yield u
+        Q.extend(u.lps_in)
+
+
+def add_pattern(root, P, p):
+    """
+    Append pattern p to the list P and insert it into the AC automaton root
+    that was built from P. Only the lps links and outputs of nodes
+    that end with a new prefix are repaired; no full BFS pass is needed.
+    Return the index of the new pattern.
+    """
+    _index_lps(root)
+    i = len(P)
+    P.append(p)
+    node = root
+    for a in p:
+        if a in node.targets:
+            node = node.targets[a]
+            continue
+        v = ACNode(parent=node, letter=a)
+        v.lps_in = []
+        node.targets[a] = v
+        lps = node.lps
+        while lps is not None and a not in lps.targets:
+            lps = lps.lps
+        v.lps = lps.targets[a] if lps is not None else root
+        v.lps.lps_in.append(v)
+        v.out = list(v.lps.out)
+        # v becomes the lps of the a-children of nodes whose lps chain
+        # reaches node before reaching another node with an a-child;
+        # their outputs do not change, because v has no own output yet.
+        Q = collections.deque(node.lps_in)
+        while len(Q) > 0:
+            y = Q.popleft()
+            if a in y.targets:
+                u = y.targets[a]
+                u.lps.lps_in.remove(u)
+                u.lps = v
+                v.lps_in.append(u)
             else:
-              label = root.label
-              next = True
-              while next != False:
-                temp = AC_build(P)
-                label = label[1:]
-                for z in label:
-                  temp = temp.delta(z)
-                if temp.lps is not None:
-                  root = temp
-                  break
-                if len(label) == 0:
-                  root = AC_build(P)
-                  break
-        # going back to root and reset.
-        elif root.lps is None: 
-          label = root.label
-          next = True
-          while next != False:
-            temp = AC_build(P)
-            label = label[1:]
-            for l in label:
-              temp = temp.delta(l)
-            if temp.lps is not None:
-              root = temp
-              break
-            if len(label) == 0:
-              root = AC_build(P)
-              break 
-        if T[i] in root.targets: #comparing with the current letter
-            root = root.delta(T[i])
-            
-      #Checking if output has any value then yield
-      if len(root.out) != 0:
-        for output in root.out:
-          p_len = len(P[output])
-          start = i - p_len + 1
-          end = i + 1
-          pattern_index = output
-          found = (start, end, pattern_index)
-          print(found)
-          if (T[start:end] == P[output]):
-            yield found
-
-    #  When text is finished iterating (checking to see the remaining matching patter from last terminal state)
-    done = True
-    label_last = root.label
-    while done != False:
-        temp_last = AC_build(P)
-        label_last = label_last[1:]
-        if len(label_last) == 0:
-          break
+                Q.extend(y.lps_in)
+        node = v
+    # i is the largest index, so it goes after the own outputs of node,
+    # and at the corresponding place in each node with node on its lps chain
+    nown = len(node.out) - (len(node.lps.out) if node.lps is not None else 0)
+    node.out.insert(nown, i)
+    where = {node: nown}
+    for u in _lps_subtree(node):
+        nown = len(u.out) - (len(u.lps.out) - 1)
+        where[u] = nown + where[u.lps]
+        u.out.insert(where[u], i)
+    return i
+
+
+def remove_pattern(root, P, i):
+    """
+    Remove pattern P[i] from the AC automaton root that was built from P;
+    P[i] is set to None, so that the other indices stay valid.
+    Trie nodes that are no longer needed are deleted and the nodes
+    that pointed to them by lps links are relinked to their lps.
+    """
+    _index_lps(root)
+    node = root
+    for a in P[i]:
+        node = node.targets[a]
+    P[i] = None
+    node.out.remove(i)
+    for u in _lps_subtree(node):
+        u.out.remove(i)
+    while node.parent is not None and len(node.targets) == 0 and len(node.out) == len(node.lps.out):
+        del node.parent.targets[node.letter]
+        node.lps.lps_in.remove(node)
+        for u in node.lps_in:
+            u.lps = node.lps
+            node.lps.lps_in.append(u)
+        node = node.parent
+
+
+#####################################################
+# Parallel scanning with a shared-memory automaton
+
+_shared = None  # (table, shared memory blocks) attached in a worker process
+
+
+def AC_share(table):
+    """
+    copy the arrays of an ACTable or ACTrie into shared memory blocks.
+    Return (blocks, spec): the caller owns the blocks and must close and unlink them;
+    spec is a picklable description for AC_attach.
+    """
+    blocks, fields = [], []
+    for (name, array) in table._asdict().items():
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+        blocks.append(shm)
+        fields.append((shm.name, array.shape, array.dtype.str))
+    return blocks, (type(table).__name__, fields)
+
+
+def AC_attach(spec):
+    """
+    attach to an automaton placed in shared memory by AC_share (without copying).
+    Return (table, blocks); the blocks must stay referenced while the table is used.
+    """
+    kind = ACTrie if spec[0] == "ACTrie" else ACTable
+    blocks, arrays = [], []
+    for (name, shape, dtype) in spec[1]:
+        shm = shared_memory.SharedMemory(name=name)
+        blocks.append(shm)
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return kind(*arrays), blocks
+
+
+def _init_worker(spec):
+    global _shared
+    _shared = AC_attach(spec)
+
+
+def _scan_task(task):
+    """
+    worker function: scan a batch of (header, offset, lo, seq) items
+    and return a list of (header, results) where results holds the
+    (start, stop, pattern_index) rows with stop > lo, in record coordinates.
+    """
+    table = _shared[0]
+    found = []
+    for (header, offset, lo, seq) in task:
+        text = np.frombuffer(seq, dtype=np.uint8)
+        results = np.empty((max(16, text.size // 16), 3), dtype=np.int64)
+        k, _ = _ac_scan_any(table, text, results, 0, offset)
+        if k > results.shape[0]:
+            results = np.empty((k, 3), dtype=np.int64)
+            k, _ = _ac_scan_any(table, text, results, 0, offset)
+        results = results[:k]
+        found.append((header, results[results[:, 1] > lo]))
+    return found
+
+
+def _fasta_tasks(f, window, overlap):
+    """
+    internal generator that cuts the records of a FASTA file-like object
+    into batches of work items (header, offset, lo, seq) of about 'window' bytes.
+    Long records are split into windows that overlap by 'overlap' bytes;
+    a window owns the matches that stop after position lo of its record.
+    """
+    task, size = [], 0
+    tail = b""
+    for (header, offset, chunk) in _fasta_chunks(f, window):
+        if offset == 0:
+            tail = b""
+        seq = tail + bytes(chunk)
+        task.append((header, offset - len(tail), offset, seq))
+        size += len(seq)
+        tail = seq[max(0, len(seq) - overlap):] if overlap > 0 else b""
+        if size >= window:
+            yield task
+            task, size = [], 0
+    if task:
+        yield task
+
+
+def parallel_scan_fasta_with_AC(table, f, processes=None, window=1 << 22):
+    """
+    Scan each record of a FASTA file-like object (opened in binary mode)
+    with a pool of worker processes that share one copy of the automaton.
+    Records (or overlapping windows of long records) are fanned out to the pool;
+    yield (header, start, stop, pattern_index) in the same order as scan_fasta_with_AC.
+    """
+    overlap = int(table.lengths.max()) - 1 if table.lengths.size > 0 else 0
+    blocks, spec = AC_share(table)
+    try:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(spec,)) as pool:
+            for found in pool.imap(_scan_task, _fasta_tasks(f, window, overlap)):
+                for (header, results) in found:
+                    for row in results.tolist():
+                        yield (header, *row)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+#####################################################
+# Compact array-backed automaton for huge dictionaries
+
+# Parallel arrays over the states in BFS order; state 0 is the root.
+# letter[q] is the byte on the trie edge into q,
+# the children of q are the states child[q] .. child[q+1]-1, sorted by letter,
+# lps[q] is the lps link of q (-1 for the root),
+# dictlink[q] is the nearest state on the lps chain of q where a pattern ends (-1 if none),
+# term[q] is the smallest index of a pattern ending at q (-1 if none),
+# samenext[i] is the next index of a pattern equal to pattern i (-1 if none),
+# lengths[i] is the length of pattern i.
+# Output sets are not stored per state; they are shared through dictlink.
+ACTrie = collections.namedtuple("ACTrie",
+    ["letter", "child", "lps", "dictlink", "term", "samenext", "lengths"])
+
+
+@njit(locals=dict(lo=int64, hi=int64, mid=int64))
+def _ac_child(letter, child, q, c):
+    """child of state q by byte c in an ACTrie (binary search), or -1"""
+    lo, hi = child[q], child[q+1]
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if letter[mid] < c:
+            lo = mid + 1
+        else:
+            hi = mid
+    if lo < child[q+1] and letter[lo] == c:
+        return lo
+    return -1
+
+
+@njit
+def _ac_step_compact(letter, child, lps, q, c):
+    """next state of an ACTrie after reading byte c in state q"""
+    while True:
+        r = _ac_child(letter, child, q, c)
+        if r >= 0:
+            return r
+        if q == 0:
+            return 0
+        q = lps[q]
+
+
+@njit
+def _ac_compact_links(letter, child, term, lps, dictlink):
+    """compute lps and dictlink of an ACTrie in BFS order"""
+    for q in range(letter.size):
+        for r in range(child[q], child[q+1]):
+            f = lps[q]
+            g = 0
+            while f >= 0:
+                g = _ac_child(letter, child, f, letter[r])
+                if g >= 0:
+                    break
+                f = lps[f]
+            lps[r] = g if g >= 0 else 0
+            dictlink[r] = lps[r] if term[lps[r]] >= 0 else dictlink[lps[r]]
+
+
+def AC_build_compact(P):
+    """
+    build the AC automaton for list of patterns P as an ACTrie.
+    The trie is built level by level from the sorted patterns with numpy,
+    so no Python object is created per state;
+    a state costs 17 bytes instead of an ACNode with its dict, list and label.
+    """
+    pats = [p.encode("latin-1") if isinstance(p, str) else bytes(p) for p in P]
+    m = len(pats)
+    lengths = np.array([len(p) for p in pats], dtype=np.int32)
+    offsets = np.zeros(m+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    flat = np.frombuffer(b"".join(pats), dtype=np.uint8)
+    order = np.array(sorted(range(m), key=pats.__getitem__), dtype=np.int64)  # stable
+    del pats
+    samenext = np.full(m, -1, dtype=np.int32)
+    parents, letters, terms = [np.array([-1])], [np.zeros(1, dtype=np.uint8)], []
+
+    def add_terms(nodes, pats):
+        # nodes and pats are in sorted order, so equal patterns are adjacent
+        if nodes.size == 0:
+            return
+        same = nodes[1:] == nodes[:-1]
+        samenext[pats[:-1][same]] = pats[1:][same]
+        first = np.ones(nodes.size, dtype=bool)
+        first[1:] = ~same
+        terms.append((nodes[first], pats[first]))
+
+    add_terms(np.zeros(np.count_nonzero(lengths == 0), dtype=np.int64), order[lengths[order] == 0])
+    alive = order[lengths[order] > 0]  # patterns longer than the current depth
+    node = np.zeros(alive.size, dtype=np.int64)  # their current state
+    nstates, depth = 1, 0
+    while alive.size > 0:
+        c = flat[offsets[alive] + depth]
+        new = np.ones(alive.size, dtype=bool)
+        new[1:] = (node[1:] != node[:-1]) | (c[1:] != c[:-1])
+        parents.append(node[new])
+        letters.append(c[new])
+        node = nstates - 1 + np.cumsum(new)
+        nstates += np.count_nonzero(new)
+        depth += 1
+        ends = lengths[alive] == depth
+        add_terms(node[ends], alive[ends])
+        alive, node = alive[~ends], node[~ends]
+    # parents are non-decreasing in BFS order, so children are contiguous
+    child = np.searchsorted(np.concatenate(parents), np.arange(nstates+1)).astype(np.int32)
+    del parents
+    letter = np.concatenate(letters)
+    term = np.full(nstates, -1, dtype=np.int32)
+    for (nodes, pats) in terms:
+        term[nodes] = pats
+    lps = np.full(nstates, -1, dtype=np.int32)
+    dictlink = np.full(nstates, -1, dtype=np.int32)
+    _ac_compact_links(letter, child, term, lps, dictlink)
+    return ACTrie(letter, child, lps, dictlink, term, samenext, lengths)
+
+
+@njit(locals=dict(k=int64, q=int64, p=int64, c=uint8))
+def ac_scan_compact(letter, child, lps, dictlink, term, samenext, lengths, text, results,
+        state=0, offset=0):
+    """
+    just-in-time compiled Aho-Corasick scan over a uint8 text using an ACTrie;
+    same conventions as ac_scan.
+    """
+    k = 0
+    N = results.shape[0]
+    q = state
+    for p, c in enumerate(text):
+        q = _ac_step_compact(letter, child, lps, q, c)
+        o = q if term[q] >= 0 else dictlink[q]
+        while o >= 0:
+            i = term[o]
+            while i >= 0:
+                if k < N:
+                    results[k, 0] = offset + p + 1 - lengths[i]
+                    results[k, 1] = offset + p + 1
+                    results[k, 2] = i
+                k += 1
+                i = samenext[i]
+            o = dictlink[o]
+    return k, q
+
+
+#####################################################
+# Reporting modes
+
+# "full": every (possibly overlapping) match;
+# "count": number of matches of each pattern, without materializing matches;
+# "first": only the first match (earliest stop, then longest), stop scanning there;
+# "leftmost": non-overlapping matches, leftmost first, longest at each start.
+MODES = ("full", "count", "first", "leftmost")
+
+
+@njit(locals=dict(q=int32, c=uint8))
+def ac_visits(delta, text, visits, state=0):
+    """
+    just-in-time compiled scan that only counts how often each state is visited
+    (no output lists are walked); return the final state.
+    """
+    q = state
+    for c in text:
+        q = delta[q, c]
+        visits[q] += 1
+    return q
+
+
+@njit(locals=dict(q=int64, c=uint8))
+def ac_visits_compact(letter, child, lps, text, visits, state=0):
+    """ac_visits for an ACTrie"""
+    q = state
+    for c in text:
+        q = _ac_step_compact(letter, child, lps, q, c)
+        visits[q] += 1
+    return q
+
+
+@njit
+def _ac_compact_counts(dictlink, term, samenext, visits, counts):
+    """add the matches implied by the state visits of an ACTrie to counts"""
+    acc = visits.copy()
+    for q in range(acc.size - 1, 0, -1):  # reverse BFS order: dictlink[q] comes earlier
+        if dictlink[q] >= 0:
+            acc[dictlink[q]] += acc[q]
+    for q in range(acc.size):
+        i = term[q]
+        while i >= 0:
+            counts[i] += acc[q]
+            i = samenext[i]
+
+
+@njit(locals=dict(q=int32, p=int64, c=uint8))
+def ac_first(delta, outstart, text, state=0):
+    """
+    just-in-time compiled scan that stops at the first state with output;
+    return (p, q): the text position and the state there, or (-1, final state).
+    """
+    q = state
+    for p, c in enumerate(text):
+        q = delta[q, c]
+        if outstart[q+1] > outstart[q]:
+            return p, q
+    return -1, q
+
+
+@njit(locals=dict(q=int64, p=int64, c=uint8))
+def ac_first_compact(letter, child, lps, dictlink, term, text, state=0):
+    """ac_first for an ACTrie"""
+    q = state
+    for p, c in enumerate(text):
+        q = _ac_step_compact(letter, child, lps, q, c)
+        if term[q] >= 0 or dictlink[q] >= 0:
+            return p, q
+    return -1, q
+
+
+@njit(locals=dict(k=int64, q=int32, p=int64, start=int64))
+def ac_leftmost(delta, outstart, outlist, lengths, maxlen, text, results, state=0, offset=0):
+    """
+    just-in-time compiled scan for non-overlapping leftmost-longest matches,
+    written into 'results' like in ac_scan.
+    The best candidate (smallest start, then longest) is reported as soon as
+    no later match can start before it; scanning then restarts at the root
+    directly behind the reported match.
+    """
+    k = 0
+    N = results.shape[0]
+    n = text.size
+    q = state
+    cstart, cstop, ci = -1, 0, 0  # candidate match
+    p = 0
+    while p < n:
+        q = delta[q, text[p]]
+        for j in range(outstart[q], outstart[q+1]):
+            i = outlist[j]
+            start = p + 1 - lengths[i]
+            if cstart < 0 or start < cstart or (start == cstart and p + 1 - start > cstop - cstart):
+                cstart, cstop, ci = start, p + 1, i
+        if cstart >= 0 and (p + 1 - cstart >= maxlen or p == n - 1):
+            if k < N:
+                results[k, 0] = offset + cstart
+                results[k, 1] = offset + cstop
+                results[k, 2] = ci
+            k += 1
+            p, q, cstart = cstop, 0, -1
+            continue
+        p += 1
+    return k, q
+
+
+@njit(locals=dict(k=int64, q=int64, p=int64, start=int64))
+def ac_leftmost_compact(letter, child, lps, dictlink, term, samenext, lengths, maxlen,
+        text, results, state=0, offset=0):
+    """ac_leftmost for an ACTrie"""
+    k = 0
+    N = results.shape[0]
+    n = text.size
+    q = state
+    cstart, cstop, ci = -1, 0, 0  # candidate match
+    p = 0
+    while p < n:
+        q = _ac_step_compact(letter, child, lps, q, text[p])
+        o = q if term[q] >= 0 else dictlink[q]
+        while o >= 0:
+            i = term[o]
+            start = p + 1 - lengths[i]
+            if cstart < 0 or start < cstart or (start == cstart and p + 1 - start > cstop - cstart):
+                cstart, cstop, ci = start, p + 1, i
+            o = dictlink[o]
+        if cstart >= 0 and (p + 1 - cstart >= maxlen or p == n - 1):
+            if k < N:
+                results[k, 0] = offset + cstart
+                results[k, 1] = offset + cstop
+                results[k, 2] = ci
+            k += 1
+            p, q, cstart = cstop, 0, -1
+            continue
+        p += 1
+    return k, q
+
+
+def _maxlen(table):
+    return int(table.lengths.max()) if table.lengths.size > 0 else 0
+
+
+def _ac_leftmost_any(table, text, results, state=0, offset=0):
+    if isinstance(table, ACTrie):
+        return ac_leftmost_compact(*table, _maxlen(table), text, results, state, offset)
+    return ac_leftmost(table.delta, table.outstart, table.outlist, table.lengths, _maxlen(table),
+        text, results, state, offset)
+
+
+def _ac_first_any(table, text, state=0):
+    if isinstance(table, ACTrie):
+        return ac_first_compact(table.letter, table.child, table.lps, table.dictlink, table.term,
+            text, state)
+    return ac_first(table.delta, table.outstart, text, state)
+
+
+def _ac_first_match(table, q, stop):
+    """(start, stop, pattern_index) of the first output of state q"""
+    if isinstance(table, ACTrie):
+        i = int(table.term[q] if table.term[q] >= 0 else table.term[table.dictlink[q]])
+    else:
+        i = int(table.outlist[table.outstart[q]])
+    return (stop - int(table.lengths[i]), stop, i)
+
+
+def _count_pieces(table, pieces):
+    """yield (pattern_index, count) for the matches in all (header, offset, chunk) pieces"""
+    compact = isinstance(table, ACTrie)
+    visits = np.zeros(table.lps.size, dtype=np.int64)
+    q = 0
+    for (header, offset, chunk) in pieces:
+        if offset == 0:
+            q = 0
+        text = _text_array(chunk)
+        if compact:
+            q = ac_visits_compact(table.letter, table.child, table.lps, text, visits, q)
         else:
-          for letter in label_last:
-              temp_last = temp_last.delta(letter)
-          if temp_last.lps is not None:
-              root = temp_last      
-              break
-            
-    if len(root.out) != 0:
-        for output in root.out:
-            p_len = len(P[output])
-            start = i - p_len + 1
-            end = i + 1
-            pattern_index = output
-            found = (start, end, pattern_index)
-            if (T[start:end] == P[output]):
-                yield found
+            q = ac_visits(table.delta, text, visits, q)
+    counts = np.zeros(table.lengths.size, dtype=np.int64)
+    if compact:
+        _ac_compact_counts(table.dictlink, table.term, table.samenext, visits, counts)
+    else:
+        np.add.at(counts, table.outlist, np.repeat(visits, np.diff(table.outstart)))
+    for i in np.flatnonzero(counts).tolist():
+        yield (i, int(counts[i]))
+
+
+def _join_records(pieces):
+    """join the (header, offset, chunk) pieces of each record into one piece"""
+    header, seq = None, None
+    for (h, offset, chunk) in pieces:
+        if offset == 0:
+            if seq is not None:
+                yield (header, 0, seq)
+            header, seq = h, bytearray()
+        seq.extend(_text_array(chunk).tobytes())
+    if seq is not None:
+        yield (header, 0, seq)
+
+
+#####################################################
+# IUPAC patterns on both strands
+
+IUPAC = {"A": "A", "C": "C", "G": "G", "T": "T", "U": "T",
+    "R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+    "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT"}
+IUPAC_COMPLEMENT = str.maketrans("ACGTURYSWKMBDHVN", "TGCAAYRSWMKVHDBN")
+
+
+def reverse_complement_iupac(p):
+    """reverse complement of a (degenerate) IUPAC nucleotide pattern"""
+    return p.upper().translate(IUPAC_COMPLEMENT)[::-1]
+
+
+def AC_build_iupac(P, both_strands=False, maxstates=1 << 20):
+    """
+    build a single automaton for IUPAC nucleotide patterns P
+    (optionally together with their reverse complements).
+    A text byte matches a pattern code if the text code denotes a subset
+    of the pattern code's bases (case-insensitive), so text N only matches N.
+    Degenerate codes are not expanded into literal patterns; instead, the
+    trie of codes is turned into a DFA by subset construction, whose states
+    are the sets of trie nodes that are active at a text position.
+    Return (table, origin, strand): an ACTable over the compiled patterns
+    (its lps links are undefined, -1) and, for each compiled pattern,
+    the index of the original pattern and its strand (+1 or -1).
+    """
+    codes, origin, strand = [], [], []
+    for (i, p) in enumerate(P):
+        p = p.upper()
+        if any(a not in IUPAC for a in p):
+            raise ValueError(f"pattern {p!r} contains non-IUPAC characters")
+        codes.append(p); origin.append(i); strand.append(1)
+        if both_strands:
+            rc = reverse_complement_iupac(p)
+            if rc != p:  # palindromes are reported once, on the forward strand
+                codes.append(rc); origin.append(i); strand.append(-1)
+    # trie over the pattern codes
+    children, own, depth = [dict()], [[]], [0]
+    for (j, p) in enumerate(codes):
+        v = 0
+        for a in p:
+            if a not in children[v]:
+                children[v][a] = len(children)
+                children.append(dict()); own.append([]); depth.append(depth[v] + 1)
+            v = children[v][a]
+        own[v].append(j)
+    # text bytes and the pattern codes they match
+    matches = dict()
+    for (t, tbases) in IUPAC.items():
+        codes_t = [a for (a, bases) in IUPAC.items() if set(tbases) <= set(bases)]
+        matches[ord(t)] = matches[ord(t.lower())] = codes_t
+    # subset construction; a DFA state is a tuple of trie nodes, deepest first
+    start = (0,)
+    ids = {start: 0}
+    states = [start]
+    rows = []
+    for S in states:  # grows while iterating
+        row = dict()
+        for (c, codes_c) in matches.items():
+            T = {0}
+            for v in S:
+                for a in codes_c:
+                    w = children[v].get(a)
+                    if w is not None:
+                        T.add(w)
+            T = tuple(sorted(T, key=lambda w: (-depth[w], w)))
+            if T not in ids:
+                if len(states) >= maxstates:
+                    raise ValueError(f"IUPAC automaton exceeds {maxstates} states")
+                ids[T] = len(states)
+                states.append(T)
+            row[c] = ids[T]
+        rows.append(row)
+    nstates = len(states)
+    delta = np.zeros((nstates, 256), dtype=np.int32)  # other bytes lead back to the start
+    outstart = np.zeros(nstates+1, dtype=np.int32)
+    outlist = []
+    for (q, (S, row)) in enumerate(zip(states, rows)):
+        for (c, r) in row.items():
+            delta[q, c] = r
+        out = [j for v in S for j in own[v]]
+        outlist.extend(out)
+        outstart[q+1] = outstart[q] + len(out)
+    table = ACTable(delta, np.full(nstates, -1, dtype=np.int32), outstart,
+        np.array(outlist, dtype=np.int32), np.array([len(p) for p in codes], dtype=np.int32))
+    return table, np.array(origin, dtype=np.int32), np.array(strand, dtype=np.int8)
+
+
+def search_iupac_with_AC(P, T, both_strands=False, mode="full"):
+    """
+    Search IUPAC nucleotide patterns P in text T in a single pass,
+    optionally on both strands;
+    yield each (start, stop, pattern_index, strand) with strand "+" or "-";
+    in "count" mode, yield (pattern_index, strand, count).
+    """
+    table, origin, strand = AC_build_iupac(P, both_strands)
+    for found in scan_with_AC(table, T, mode=mode):
+        yield _iupac_found(found, origin, strand, mode == "count")
+
+
+def _iupac_found(found, origin, strand, count=False):
+    """
+    map a match (..., compiled_index) of a compiled IUPAC pattern
+    to (..., pattern_index, strand); in count mode, map
+    (compiled_index, count) to (pattern_index, strand, count).
+    """
+    if count:
+        (j, n) = found
+        return (int(origin[j]), "+" if strand[j] > 0 else "-", n)
+    j = found[-1]
+    return (*found[:-1], int(origin[j]), "+" if strand[j] > 0 else "-")
+
+
+#####################################################
+# Approximate matching with k mismatches
+
+# Pigeonhole filter: each pattern is cut into k+1 seeds; an occurrence with
+# at most k mismatches contains at least one seed exactly.
+# The seeds are searched with one AC automaton (table), each seed hit is
+# verified against the whole pattern.
+# seedpat[j], seedoff[j]: pattern of seed j and its offset in the pattern;
+# the seeds of pattern i are seedfirst[i] .. seedfirst[i+1]-1, in order;
+# flat[patstart[i]:patstart[i]+lengths[i]] is pattern i.
+ACSeeds = collections.namedtuple("ACSeeds",
+    ["table", "seedpat", "seedoff", "seedfirst", "flat", "patstart", "lengths", "k"])
+
+
+def AC_build_mismatch(P, k):
+    """build the seed automaton for searching patterns P with at most k mismatches"""
+    pats = [p.encode("latin-1") if isinstance(p, str) else bytes(p) for p in P]
+    seeds, seedpat, seedoff, seedfirst = [], [], [], [0]
+    for (i, p) in enumerate(pats):
+        m = len(p)
+        if m <= k:
+            raise ValueError(f"pattern {i} is too short for {k} mismatches")
+        cuts = [(m * t) // (k + 1) for t in range(k + 2)]
+        for (a, b) in zip(cuts, cuts[1:]):
+            seeds.append(p[a:b].decode("latin-1"))
+            seedpat.append(i)
+            seedoff.append(a)
+        seedfirst.append(len(seeds))
+    lengths = np.array([len(p) for p in pats], dtype=np.int32)
+    patstart = np.zeros(len(pats) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=patstart[1:])
+    return ACSeeds(AC_build(seeds, dfa=True), np.array(seedpat, dtype=np.int32),
+        np.array(seedoff, dtype=np.int32), np.array(seedfirst, dtype=np.int32),
+        np.frombuffer(b"".join(pats), dtype=np.uint8), patstart, lengths, k)
+
+
+@njit(locals=dict(kk=int64, q=int32, p=int64, c=uint8, s=int64, mis=int64, seg=int64))
+def ac_scan_mismatch(delta, outstart, outlist, seedlens, seedpat, seedoff, seedfirst,
+        flat, patstart, lengths, k, text, results):
+    """
+    just-in-time compiled k-mismatch search: scan text for exact seed hits
+    and verify each candidate alignment against its pattern.
+    An alignment is reported only by its first exactly matching seed,
+    so every occurrence appears once.
+    Write (start, stop, pattern_index, mismatches) rows into 'results'
+    (int64, shape (N, 4)) in the order of the seed hits;
+    return the number of occurrences.
+    """
+    kk = 0
+    N = results.shape[0]
+    n = text.size
+    q = 0
+    for p, c in enumerate(text):
+        q = delta[q, c]
+        for jj in range(outstart[q], outstart[q+1]):
+            j = outlist[jj]
+            i = seedpat[j]
+            m = lengths[i]
+            s = p + 1 - seedlens[j] - seedoff[j]
+            if s < 0 or s + m > n:
+                continue
+            # earlier seeds must have a mismatch, otherwise they report this alignment
+            mis = 0
+            first = True
+            for r in range(seedfirst[i], j):
+                seg = 0
+                for x in range(seedoff[r], seedoff[r] + seedlens[r]):
+                    if text[s + x] != flat[patstart[i] + x]:
+                        seg += 1
+                if seg == 0:
+                    first = False
+                    break
+                mis += seg
+                if mis > k:
+                    break
+            if not first or mis > k:
+                continue
+            for x in range(seedoff[j] + seedlens[j], m):
+                if text[s + x] != flat[patstart[i] + x]:
+                    mis += 1
+                    if mis > k:
+                        break
+            if mis > k:
+                continue
+            if kk < N:
+                results[kk, 0] = s
+                results[kk, 1] = s + m
+                results[kk, 2] = i
+                results[kk, 3] = mis
+            kk += 1
+    return kk
+
+
+def scan_mismatch_with_AC(seeds, T, nresults=1 << 16):
+    """
+    Scan text T with an ACSeeds automaton (see AC_build_mismatch);
+    yield each (start, stop, pattern_index, mismatches), sorted by start and pattern.
+    """
+    text = _text_array(T)
+    table = seeds.table
+    args = (table.delta, table.outstart, table.outlist, table.lengths, seeds.seedpat,
+        seeds.seedoff, seeds.seedfirst, seeds.flat, seeds.patstart, seeds.lengths, seeds.k, text)
+    results = np.empty((nresults, 4), dtype=np.int64)
+    k = ac_scan_mismatch(*args, results)
+    if k > nresults:
+        results = np.empty((k, 4), dtype=np.int64)
+        k = ac_scan_mismatch(*args, results)
+    results = results[:k]
+    results = results[np.lexsort((results[:, 2], results[:, 0]))]
+    for found in results.tolist():
+        yield tuple(found)
+
+
+def search_mismatch_with_AC(P, T, k):
+    """
+    Search patterns P in text T allowing up to k mismatches;
+    yield each (start, stop, pattern_index, mismatches).
+    """
+    yield from scan_mismatch_with_AC(AC_build_mismatch(P, k), T)
+
+
+#####################################################
+# On-disk cache of compiled automata
+
+CACHE_VERSION = b"ACTable-1"  # change whenever the ACTable layout changes
+
+
+def AC_key(P, kind=ACTable):
+    """hex digest that identifies the pattern list P (order matters) and the representation"""
+    h = hashlib.sha256(CACHE_VERSION + kind.__name__.encode("ASCII"))
+    for p in P:
+        p = p.encode("UTF-8") if isinstance(p, str) else bytes(p)
+        h.update(len(p).to_bytes(8, "little"))
+        h.update(p)
+    return h.hexdigest()
+
+
+def AC_save(table, directory):
+    """save an ACTable or ACTrie as one .npy file per array in the given directory"""
+    os.makedirs(directory, exist_ok=True)
+    for (name, array) in table._asdict().items():
+        np.save(os.path.join(directory, name + ".npy"), array)
+
+
+def AC_load(directory, mmap_mode="r"):
+    """
+    load an ACTable or ACTrie saved by AC_save.
+    With mmap_mode="r" (default), the arrays are memory-mapped read-only,
+    so loading takes constant time and the pages are shared between processes.
+    """
+    kind = ACTable if os.path.exists(os.path.join(directory, "delta.npy")) else ACTrie
+    return kind(*(np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+        for name in kind._fields))
+
+
+def _directory_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+
+def AC_evict(cachedir, maxsize, keep=None):
+    """
+    remove least recently used entries from cachedir
+    until the total size is at most maxsize bytes; never remove the entry 'keep'.
+    """
+    entries = []
+    for entry in os.scandir(cachedir):
+        if entry.is_dir() and not entry.name.startswith("."):
+            entries.append((entry.stat().st_mtime, entry.name, _directory_size(entry.path)))
+    total = sum(size for (_, _, size) in entries)
+    for (_, name, size) in sorted(entries):
+        if total <= maxsize:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(os.path.join(cachedir, name), ignore_errors=True)
+        total -= size
+
+
+def AC_cached(P, cachedir, maxsize=2 << 30, compact=False):
+    """
+    return the compiled ACTable (or ACTrie if compact=True)
+    for patterns P from the cache directory,
+    building and storing it first if it is not there yet.
+    Entries are keyed by AC_key(P); the cache is trimmed to maxsize bytes
+    by evicting the least recently used entries.
+    """
+    key = AC_key(P, ACTrie if compact else ACTable)
+    directory = os.path.join(cachedir, key)
+    if os.path.isdir(directory):
+        os.utime(directory)  # mark as recently used
+        return AC_load(directory)
+    os.makedirs(cachedir, exist_ok=True)
+    table = AC_build_compact(P) if compact else AC_build(P, dfa=True)
+    # write into a temporary directory first, so that concurrent jobs
+    # never see a partially written entry
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=cachedir)
+    AC_save(table, tmp)
+    try:
+        os.rename(tmp, directory)
+    except OSError:  # another job stored the same key in the meantime
+        shutil.rmtree(tmp, ignore_errors=True)
+    AC_evict(cachedir, maxsize, keep=key)
+    return table
+
+
+#####################################################
+# main
+
+def get_patterns(args):
+    if args.pattern is not None:
+        return args.pattern
+    with open(args.patternfile, "r") as fpat:
+        return [line.strip() for line in fpat if line.strip()]
 
 
 def main(args):
-    T = args.text
-    P = args.pattern
-    ret = search_with_AC(P,T)
-    print(list(ret))
+    P = get_patterns(args)
+    origin = strand = None
+    if args.genome_cache and args.fasta is not None and load_genome_cache(args.fasta) is None:
+        make_genome_cache(args.fasta)
+    if args.mismatches > 0:
+        seeds = AC_build_mismatch(P, args.mismatches)
+        if args.text is not None:
+            print(list(scan_mismatch_with_AC(seeds, args.text)))
+            return
+        with open(args.fasta, "rb") as f:
+            for (header, _, seq) in _join_records(_fasta_chunks(f)):
+                print("#", header.decode("ASCII"))
+                for found in scan_mismatch_with_AC(seeds, seq):
+                    print(*found, sep="\t")
+        return
+    if args.iupac or args.both_strands:
+        table, origin, strand = AC_build_iupac(P, both_strands=args.both_strands)
+    elif args.cache is not None:
+        table = AC_cached(P, args.cache, maxsize=args.cachesize << 20, compact=args.compact)
+    else:
+        table = AC_build_compact(P) if args.compact else AC_build(P, dfa=True)
+    if args.text is not None:
+        ret = scan_with_AC(table, args.text, mode=args.mode)
+        if origin is not None:
+            ret = (_iupac_found(found, origin, strand, args.mode == "count") for found in ret)
+        print(list(ret))
+        return
+    with open(args.fasta, "rb") as f:
+        if args.mode == "count":
+            for found in scan_fasta_with_AC(table, f, mode="count"):
+                if origin is not None:
+                    found = _iupac_found(found, origin, strand, count=True)
+                print(*found, sep="\t")
+            return
+        if args.processes == 1 or args.mode != "full":
+            found = scan_fasta_with_AC(table, f, mode=args.mode)
+        else:
+            found = parallel_scan_fasta_with_AC(table, f, processes=args.processes or None)
+        if origin is not None:
+            found = (_iupac_found(t, origin, strand) for t in found)
+        header = None
+        for (h, *t) in found:
+            if h != header:
+                header = h
+                print("#", header.decode("ASCII"))
+            print(*t, sep="\t")
 
 def get_argument_parser():
     p = argparse.ArgumentParser(description="DNA Motif Searcher")
-    p.add_argument("-P", "--pattern", required=True, nargs="+",
+    pat = p.add_mutually_exclusive_group(required=True)
+    pat.add_argument("-P", "--pattern", nargs="+",
         help="immediate pattern to be matched")
-    p.add_argument("-T", "--text", required=True,
+    pat.add_argument("-p", "--patternfile",
+        help="name of file containing patterns (one per line)")
+    txt = p.add_mutually_exclusive_group(required=True)
+    txt.add_argument("-T", "--text",
         help="immerdiate text to be searched")
+    txt.add_argument("--fasta", "-f",
+        help="FASTA file to be searched record by record (streamed in constant memory)")
+    p.add_argument("--mode", "-m", default="full", choices=MODES,
+        help="reporting mode: all matches ('full', default), matches per pattern ('count'), "
+            "first match ('first', per record), non-overlapping leftmost-longest matches ('leftmost')")
+    p.add_argument("--processes", "-j", type=int, default=1,
+        help="number of worker processes for --fasta (0: all cores) [1]")
+    p.add_argument("--mismatches", "-k", type=int, default=0,
+        help="report (start, stop, index, mismatches) of matches with at most this many mismatches [0]")
+    p.add_argument("--iupac", action="store_true",
+        help="patterns are IUPAC nucleotide codes (N, R, Y, ...); the automaton cache is not used")
+    p.add_argument("--both-strands", "-b", action="store_true",
+        help="also search the reverse complements of the (IUPAC) patterns; report the strand")
+    p.add_argument("--compact", action="store_true",
+        help="use the compact array-backed trie instead of the dense DFA (for huge dictionaries)")
+    p.add_argument("--cache", metavar="DIR",
+        default=os.environ.get("AC_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "aho_corasick")),
+        help="directory for cached automata (default: $AC_CACHE or ~/.cache/aho_corasick)")
+    p.add_argument("--no-cache", dest="cache", action="store_const", const=None,
+        help="always build the automaton, do not use the cache")
+    p.add_argument("--cachesize", type=int, default=2048,
+        help="maximum size of the cache directory in MB [2048]")
+    p.add_argument("--genome-cache", action="store_true",
+        help="convert the FASTA file into a binary cache (FASTA.seq, FASTA.idx.npz) "
+            "if it has none; an up-to-date cache is always used")
     return p
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+"""
+Benchmarks for aho_corasick.py
+
+Run, for example:
+python aho_corasick_bench.py update --sizes 1000 10000 50000
+python aho_corasick_bench.py mismatch --barcodes 10000 --length 16 -k 1 2 --textsize 10000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from aho_corasick import AC_build, add_pattern, remove_pattern, _index_lps
+from aho_corasick import AC_build_mismatch, scan_mismatch_with_AC
+
+
+def random_patterns(rng, n, minlen=16, maxlen=32, alphabet="ACGT"):
+    """list of n random patterns with lengths in [minlen, maxlen]"""
+    letters = np.array(list(alphabet))
+    return ["".join(rng.choice(letters, size=rng.integers(minlen, maxlen+1))) for _ in range(n)]
+
+
+def bench_update(args):
+    """
+    Time a full AC_build against add_pattern/remove_pattern of a few patterns
+    for growing dictionaries; the update cost should not grow with the dictionary.
+    """
+    rng = np.random.default_rng(args.seed)
+    print("# patterns\tbuild [s]\tadd [us/pattern]\tremove [us/pattern]")
+    for n in args.sizes:
+        P = random_patterns(rng, n)
+        t0 = time.perf_counter()
+        root = AC_build(P)
+        tbuild = time.perf_counter() - t0
+        _index_lps(root)  # one-time cost, paid by the first update
+        new = random_patterns(rng, args.updates)
+        t0 = time.perf_counter()
+        indices = [add_pattern(root, P, p) for p in new]
+        tadd = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for i in indices:
+            remove_pattern(root, P, i)
+        tremove = time.perf_counter() - t0
+        print(f"{n}\t{tbuild:.3f}\t{tadd / args.updates * 1e6:.1f}\t{tremove / args.updates * 1e6:.1f}")
+
+
+def bench_mismatch(args):
+    """
+    Throughput of k-mismatch barcode search on a random text;
+    the time for 1 Gbp is extrapolated linearly.
+    """
+    rng = np.random.default_rng(args.seed)
+    P = random_patterns(rng, args.barcodes, args.length, args.length)
+    text = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=args.textsize)
+    list(scan_mismatch_with_AC(AC_build_mismatch(P[:10], 1), text[:1000]))  # compile kernels
+    print("# k\tbuild [s]\tscan [s]\thits\tMbp/s\t1 Gbp [s]")
+    for k in args.k:
+        t0 = time.perf_counter()
+        seeds = AC_build_mismatch(P, k)
+        tbuild = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        nhits = sum(1 for _ in scan_mismatch_with_AC(seeds, text))
+        tscan = time.perf_counter() - t0
+        rate = args.textsize / tscan / 1e6
+        print(f"{k}\t{tbuild:.2f}\t{tscan:.2f}\t{nhits}\t{rate:.1f}\t{1e3 / rate:.0f}")
+
+
+def get_argument_parser():
+    p = argparse.ArgumentParser(description="Aho-Corasick benchmarks")
+    p.add_argument("--seed", type=int, default=42,
+        help="random seed [42]")
+    sub = p.add_subparsers(dest="benchmark", required=True)
+    b = sub.add_parser("update", help="incremental add/remove vs. full build")
+    b.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000],
+        help="dictionary sizes [1000 10000 50000]")
+    b.add_argument("--updates", type=int, default=100,
+        help="number of patterns to add and remove [100]")
+    b.set_defaults(func=bench_update)
+    b = sub.add_parser("mismatch", help="throughput of k-mismatch barcode search")
+    b.add_argument("--barcodes", type=int, default=10_000,
+        help="number of barcodes [10000]")
+    b.add_argument("--length", type=int, default=16,
+        help="barcode length [16]")
+    b.add_argument("-k", type=int, nargs="+", default=[1, 2],
+        help="numbers of mismatches [1 2]")
+    b.add_argument("--textsize", type=int, default=10_000_000,
+        help="length of the random text [10_000_000]")
+    b.set_defaults(func=bench_mismatch)
+    return p
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+    args.func(args)
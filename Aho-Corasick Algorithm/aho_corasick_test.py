@@ -1,4 +1,13 @@
-from ahocorasick import ACNode, AC_build, search_with_AC
+import os
+import numpy as np
+import io
+import collections
+from aho_corasick import AC_build, AC_build_compact, search_with_AC, scan_with_AC, AC_cached, AC_key
+from aho_corasick import stream_with_AC, scan_fasta_with_AC, parallel_scan_fasta_with_AC
+from aho_corasick import add_pattern, remove_pattern, AC_table
+from aho_corasick import IUPAC, search_iupac_with_AC, reverse_complement_iupac
+from aho_corasick import search_mismatch_with_AC
+from aho_corasick import make_genome_cache
 
 def test_delta():
     P = ["AAB", "ABABBAB", "BAA"]
@@ -14,3 +23,155 @@ def test_search_with_AC():
     P = ["it", "toy", "bit", "you", "unit", "o"]
     T = "o joy, a toy, to you, it was a bit of a unit"
     assert list(search_with_AC(P,T)) == [(0, 1, 5), (3, 4, 5), (10, 11, 5), (9, 12, 1), (15, 16, 5), (18, 19, 5), (17, 20, 3), (22, 24, 0), (31, 34, 2), (32, 34, 0), (35, 36, 5), (40, 44, 4), (42, 44, 0)]
+
+def test_AC_table():
+    P = ["ACA", "CA", "AACAG", "GG", "A"]
+    T = "AACAGGACACAGGTTACAAACA"
+    table = AC_build(P, dfa=True)
+    assert table.delta.shape == (len(list(AC_build(P).bfs())), 256)
+    expected = sorted((i - len(p), i, j) for i in range(len(T) + 1)
+        for (j, p) in enumerate(P) if T[i-len(p):i] == p and i >= len(p))
+    assert sorted(scan_with_AC(table, T.encode("ASCII"))) == expected
+    assert sorted(scan_with_AC(table, T, nresults=2)) == expected
+
+def test_AC_cached(tmp_path):
+    P = ["AAB", "ABABBAB", "BAA"]
+    T = "AABABABBABABBABBBBBABABBAA"
+    table = AC_cached(P, tmp_path)
+    assert AC_key(P) != AC_key(P[::-1])
+    cached = AC_cached(P, tmp_path)
+    assert isinstance(cached.delta, np.memmap)
+    for (a, b) in zip(table, cached):
+        assert np.array_equal(a, b)
+    assert list(scan_with_AC(cached, T)) == list(search_with_AC(P, T))
+    AC_cached(["ACGT"], tmp_path, maxsize=0)
+    assert sorted(os.listdir(tmp_path)) == [AC_key(["ACGT"])]
+
+def test_AC_build_compact():
+    rng = np.random.default_rng(42)
+    P = ["".join(rng.choice(list("ACGT"), size=rng.integers(1, 8))) for _ in range(200)]
+    P += P[:5]  # duplicates
+    T = "".join(rng.choice(list("ACGT"), size=2000))
+    trie = AC_build_compact(P)
+    assert trie.letter.size == len(list(AC_build(P).bfs()))
+    assert list(scan_with_AC(trie, T)) == list(search_with_AC(P, T))
+    P = ["it", "toy", "bit", "you", "unit", "o"]
+    T = "o joy, a toy, to you, it was a bit of a unit"
+    assert list(search_with_AC(P, T, compact=True)) == list(search_with_AC(P, T))
+
+def test_stream_with_AC():
+    P = ["AAB", "ABABBAB", "BAA"]
+    T = b"AABABABBABABBABBBBBABABBAA"
+    expected = list(search_with_AC(P, T))
+    for compact in (False, True):
+        table = AC_build_compact(P) if compact else AC_build(P, dfa=True)
+        chunks = [T[i:i+3] for i in range(0, len(T), 3)]
+        assert list(stream_with_AC(table, chunks)) == expected
+    fasta = b">one\nAABABAB\nBABABB\n\nABBBBBABABBAA\n>two\nBA\nA\n>three\n"
+    found = list(scan_fasta_with_AC(table, io.BytesIO(fasta), chunksize=4))
+    assert found == [(b"one", *t) for t in expected] + [(b"two", 0, 3, 2)]
+
+def test_parallel_scan_fasta_with_AC():
+    rng = np.random.default_rng(7)
+    P = ["".join(rng.choice(list("ACGT"), size=rng.integers(3, 9))) for _ in range(50)]
+    records = [bytes(rng.choice(list(b"ACGT"), size=n)) for n in (5000, 30, 0, 12000)]
+    fasta = b"".join(b">r%d\n" % i + b"\n".join(r[j:j+60] for j in range(0, len(r), 60)) + b"\n"
+        for (i, r) in enumerate(records))
+    table = AC_build(P, dfa=True)
+    expected = list(scan_fasta_with_AC(table, io.BytesIO(fasta)))
+    found = list(parallel_scan_fasta_with_AC(table, io.BytesIO(fasta), processes=2, window=1000))
+    assert found == expected
+
+def test_scan_fasta_genome_cache(tmp_path):
+    rng = np.random.default_rng(8)
+    P = ["".join(rng.choice(list("ACGT"), size=rng.integers(3, 9))) for _ in range(50)]
+    records = [bytes(rng.choice(list(b"ACGT"), size=n)) for n in (5000, 30, 0, 12000)]
+    path = tmp_path / "g.fa"
+    path.write_bytes(b"".join(b">r%d\n" % i + b"\n".join(r[j:j+60] for j in range(0, len(r), 60)) + b"\n"
+        for (i, r) in enumerate(records)))
+    table = AC_build(P, dfa=True)
+    with open(path, "rb") as f:
+        expected = list(scan_fasta_with_AC(table, f, chunksize=1000))
+    make_genome_cache(str(path))
+    with open(path, "rb") as f:
+        assert list(scan_fasta_with_AC(table, f, chunksize=1000)) == expected
+    with open(path, "rb") as f:
+        assert list(parallel_scan_fasta_with_AC(table, f, processes=2, window=1000)) == expected
+
+def test_parallel_scan_short_windows(tmp_path):
+    # windows (cache chunks) shorter than the overlap of long patterns
+    rng = np.random.default_rng(9)
+    text = bytes(rng.choice(list(b"AC"), size=3000))
+    P = [text[i:i+n].decode() for (i, n) in ((100, 25), (1500, 40), (2900, 30))]
+    path = tmp_path / "g.fa"
+    path.write_bytes(b">r\n" + text + b"\n>s\n" + text[:50] + b"\n")
+    table = AC_build(P, dfa=True)
+    with open(path, "rb") as f:
+        expected = list(scan_fasta_with_AC(table, f))
+    make_genome_cache(str(path))
+    with open(path, "rb") as f:
+        assert list(parallel_scan_fasta_with_AC(table, f, processes=2, window=8)) == expected
+
+
+def test_add_remove_pattern():
+    rng = np.random.default_rng(3)
+    words = ["".join(rng.choice(list("ACG"), size=rng.integers(1, 7))) for _ in range(60)]
+    T = "".join(rng.choice(list("ACG"), size=500))
+    P = words[:30]
+    root = AC_build(P)
+    for w in words[30:]:
+        add_pattern(root, P, w)
+    for i in range(0, 60, 3):
+        remove_pattern(root, P, i)
+    add_pattern(root, P, words[0])
+    # a fresh build where removed patterns are empty (and their matches dropped)
+    fresh = AC_build([p if p is not None else "" for p in P], dfa=True)
+    expected = [t for t in scan_with_AC(fresh, T) if P[t[2]] is not None]
+    assert list(scan_with_AC(AC_table(root, P), T)) == expected
+    assert len(list(root.bfs())) == len(list(AC_build([p for p in P if p is not None]).bfs()))
+
+def test_modes():
+    P = ["it", "toy", "bit", "you", "unit", "o"]
+    T = "o joy, a toy, to you, it was a bit of a unit"
+    full = list(search_with_AC(P, T))
+    for compact in (False, True):
+        counts = dict(search_with_AC(P, T, compact=compact, mode="count"))
+        assert counts == {i: sum(1 for t in full if t[2] == i) for i in range(len(P))}
+        assert list(search_with_AC(P, T, compact=compact, mode="first")) == [full[0]]
+        assert list(search_with_AC(P, "xyz", compact=compact, mode="first")) == []
+        assert list(search_with_AC(P, T, compact=compact, mode="leftmost")) == [(0, 1, 5),
+            (3, 4, 5), (9, 12, 1), (15, 16, 5), (17, 20, 3), (22, 24, 0), (31, 34, 2),
+            (35, 36, 5), (40, 44, 4)]
+    P = ["AB", "ABCD", "BCDE", "C"]
+    assert list(search_with_AC(P, "ABCDEC", mode="leftmost")) == [(0, 4, 1), (5, 6, 3)]
+
+def test_search_iupac_with_AC():
+    P = ["ACGT", "TTA", "AAGG", "ACT"]
+    T = "ACGTTAACCTTACTAAGGTTT"
+    assert [t[:3] for t in search_iupac_with_AC(P, T)] == list(search_with_AC(P, T))
+    assert reverse_complement_iupac("ACNRY") == "RYNGT"
+    P = ["GNNAC", "RTA"]
+    T = "ggtaccGAGACttaGT"
+    found = sorted(search_iupac_with_AC(P, T, both_strands=True))
+    fits = lambda p, s: all(set(IUPAC[t]) <= set(IUPAC[a]) for (a, t) in zip(p, s.upper()))
+    expected = sorted((j, j + len(p), i, s) for (i, p) in enumerate(P)
+        for (q, s) in ((p, "+"), (reverse_complement_iupac(p), "-"))
+        for j in range(len(T) - len(p) + 1) if fits(q, T[j:j+len(p)]))
+    assert found == expected
+    assert list(search_iupac_with_AC(["AN"], "NANN")) == [(1, 3, 0, "+")]  # text N only matches pattern N
+    counts = collections.Counter((i, s) for (_, _, i, s) in expected)
+    assert dict(((i, s), n) for (i, s, n) in search_iupac_with_AC(P, T, True, mode="count")) == counts
+
+def test_search_mismatch_with_AC():
+    rng = np.random.default_rng(11)
+    P = ["".join(rng.choice(list("ACGT"), size=rng.integers(6, 12))) for _ in range(30)]
+    T = "".join(rng.choice(list("ACGT"), size=3000))
+    for k in (0, 1, 2):
+        expected = []
+        for j in range(len(T)):
+            for (i, p) in enumerate(P):
+                if j + len(p) <= len(T):
+                    mis = sum(a != b for (a, b) in zip(p, T[j:j+len(p)]))
+                    if mis <= k:
+                        expected.append((j, j + len(p), i, mis))
+        assert list(search_mismatch_with_AC(P, T, k)) == expected
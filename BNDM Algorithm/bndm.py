@@ -1,6 +1,76 @@
 import argparse  # for command line interface
+import collections
+import functools
+import gzip  # for compressed FASTA files
+import itertools
+import json  # for the calibration file
+import os  # for cache file names and timestamps
+import queue  # for the pipelined driver
+import re  # for the FASTA block reader
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor  # for parallel scanning
 import numpy as np  # for typed arrays
-from numba import njit, uint64, uint8  # for just-in-time compilation
+
+
+# lazy just-in-time compilation:
+# importing numba and compiling the kernels takes seconds, which dominates
+# short runs. Kernels are declared with a lazy 'njit' that imports numba
+# only when a kernel is first called, and are compiled with cache=True,
+# so later runs load them from numba's on-disk cache (see precompile).
+# The numba types int64, uint64, uint8 used in kernels become module globals
+# at that point; 'locals' give their types as strings.
+
+_KERNELS = []  # all lazily compiled kernels of this module
+_KERNELS_LOCK = threading.Lock()
+
+
+class _LazyKernel:
+    """placeholder for a numba kernel that is compiled on its first call"""
+
+    def __init__(self, func, options):
+        self.func, self.options = func, options
+        self.dispatcher = None
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        if self.dispatcher is None:
+            _load_kernels()
+        return self.dispatcher(*args, **kwargs)
+
+
+def njit(func=None, **options):
+    """lazy numba.njit with an on-disk cache"""
+    if func is None:
+        return lambda f: njit(f, **options)
+    kernel = _LazyKernel(func, options)
+    _KERNELS.append(kernel)
+    return kernel
+
+
+def _load_kernels():
+    """import numba and replace all lazy kernels of this module by numba dispatchers"""
+    with _KERNELS_LOCK:
+        if _KERNELS[0].dispatcher is not None:
+            return
+        import numba
+        g = globals()
+        for name in ("int64", "uint64", "uint8"):
+            g[name] = getattr(numba, name)
+        for kernel in _KERNELS:
+            options = dict(kernel.options)
+            if "locals" in options:
+                options["locals"] = {v: getattr(numba, t) for (v, t) in options["locals"].items()}
+            # callers of this kernel are compiled later and find the dispatcher in the globals
+            g[kernel.__name__] = numba.njit(cache=True, **options)(kernel.func)
+        for kernel in _KERNELS:
+            kernel.dispatcher = g[kernel.__name__]
+
+def _open_fasta(filename):
+    """internal function that opens a FASTA file for reading bytes, decompressing .gz files"""
+    return gzip.open(filename, "rb") if filename.endswith(".gz") else open(filename, "rb")
+
 
 def _fasta_reads_from_filelike(f, COMMENT=b';'[0], HEADER=b'>'[0]):
     """internal function that yields fasta records as (header: bytes, seq: bytearray)"""
@@ -23,16 +93,393 @@ def _fasta_reads_from_filelike(f, COMMENT=b';'[0], HEADER=b'>'[0]):
         yield (header, seq)
 
 
-def fasta_items(filename):
+_LINE_BREAK = re.compile(rb"[ \t\r\v\f]*\n[ \t\r\v\f]*")  # a line end with the whitespace around it
+
+
+def _special_line(data, pos):
+    """
+    internal function that returns the start of the first header or comment line
+    (possibly indented) in data at or after the line start pos, or -1
+    """
+    while True:
+        gt, sc = data.find(b">", pos), data.find(b";", pos)
+        c = gt if sc < 0 else (sc if gt < 0 else min(gt, sc))
+        if c < 0:
+            return -1
+        start = data.rfind(b"\n", pos, c) + 1 or pos
+        if not data[start:c].strip():
+            return start
+        pos = data.find(b"\n", c) + 1  # '>' or ';' within a sequence line
+        if pos == 0:
+            return -1
+
+
+def _fasta_reads_into(f, buffers, blocksize=1 << 22):
+    """
+    internal function that yields fasta records as (header: bytes, seq: uint8 array),
+    where seq is a view of one of the reusable arrays in the list buffers,
+    used in turn and replaced by a larger one when a record does not fit;
+    seq is overwritten len(buffers) records later.
+    The file is read in blocks, and the sequence lines between two header
+    or comment lines are stripped and copied at once;
+    the records are the same as those of _fasta_reads_from_filelike.
+    """
+    header = None
+    i = n = 0
+    buf = buffers[0]
+    rest = b""  # incomplete header line, or whitespace at the end of the previous block
+    midline = False  # whether the next block continues a sequence line
+
+    def append(seq):
+        nonlocal buf, n
+        if header is None or not seq:
+            return
+        if n + len(seq) > len(buf):
+            larger = np.empty(max(2 * len(buf), n + len(seq)), dtype=np.uint8)
+            larger[:n] = buf[:n]
+            buf = buffers[i] = larger
+        buf[n:n+len(seq)] = np.frombuffer(seq, dtype=np.uint8)
+        n += len(seq)
+
+    while True:
+        block = f.read(blocksize)
+        if not block and not rest:
+            break
+        data = rest + block if block else rest + b"\n"
+        rest = b""
+        pos = 0
+        if midline:  # the rest of a sequence line; whitespace before more sequence is kept
+            eol = data.find(b"\n")
+            line = data if eol < 0 else data[:eol]
+            append(line.rstrip())
+            if eol < 0:
+                rest = line[len(line.rstrip()):]
+                continue
+            midline = False
+            pos = eol + 1
+        while pos < len(data):  # at the start of a line
+            special = _special_line(data, pos)
+            stop = len(data) if special < 0 else special
+            if stop > pos:  # sequence lines
+                last = data.rfind(b"\n", pos, stop) + 1  # after the last complete line
+                if last > pos:
+                    seq = data[pos:last].translate(None, b" \t\r\n\v\f")
+                    if len(seq) + data.count(b"\n", pos, last) < last - pos:  # rare: strip each line
+                        seq = _LINE_BREAK.sub(b"", data[pos:last]).strip()
+                    append(seq)
+                line = data[max(pos, last):stop]  # only in the last block of lines
+                if line.strip():
+                    append(line.strip())
+                    rest, midline = line[len(line.rstrip()):], True
+                else:
+                    rest = line
+                if special < 0:
+                    break
+            eol = data.find(b"\n", stop)
+            if eol < 0:
+                rest = data[stop:]
+                break
+            line = data[stop:eol].strip()
+            if line[0] == b">"[0]:
+                if header is not None:
+                    yield (header, buf[:n])
+                    i = (i + 1) % len(buffers)
+                    buf = buffers[i]
+                header = line[1:]
+                n = 0
+            pos = eol + 1
+    if header is not None:
+        yield (header, buf[:n])
+
+
+# binary genome cache:
+# FILE.seq holds the sequences of all records of FILE back to back,
+# FILE.idx.npz holds the record offsets into FILE.seq, the headers,
+# and the size and modification time of FILE when the cache was made.
+
+def genome_cache_names(filename):
+    """names of the sequence and index files of the binary cache of a FASTA file"""
+    return filename + ".seq", filename + ".idx.npz"
+
+
+def _fasta_stamp(filename):
+    st = os.stat(filename)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def make_genome_cache(filename):
+    """
+    Convert a FASTA file into its binary cache, one record at a time.
+    Return the names of the sequence and index files.
+    """
+    seqname, idxname = genome_cache_names(filename)
+    headers, offsets = [], [0]
+    with _open_fasta(filename) as f, open(seqname + ".tmp", "wb") as fseq:
+        for (header, seq) in _fasta_reads_from_filelike(f):
+            fseq.write(seq)
+            headers.append(header)
+            offsets.append(offsets[-1] + len(seq))
+    with open(idxname + ".tmp", "wb") as fidx:  # np.savez would append .npz to a name
+        np.savez(fidx, offsets=np.array(offsets, dtype=np.int64),
+            headers=np.frombuffer(b"\n".join(headers), dtype=np.uint8),
+            stamp=_fasta_stamp(filename))
+    os.replace(seqname + ".tmp", seqname)
+    os.replace(idxname + ".tmp", idxname)
+    return seqname, idxname
+
+
+def load_genome_cache(filename):
+    """
+    Return (headers, offsets, seq) from the binary cache of a FASTA file,
+    or None if there is no up-to-date cache.
+    seq is a read-only memory map of all sequences (shared by all processes
+    through the page cache); record i is seq[offsets[i]:offsets[i+1]].
     """
-    generator function that yields each (header, sequence) pair from a FASTA file.
+    seqname, idxname = genome_cache_names(filename)
+    try:
+        with np.load(idxname) as idx:
+            offsets, headers, stamp = idx["offsets"], idx["headers"], idx["stamp"]
+        if not np.array_equal(stamp, _fasta_stamp(filename)):
+            return None
+        if os.path.getsize(seqname) != offsets[-1]:
+            return None
+    except (OSError, KeyError, ValueError):
+        return None
+    headers = headers.tobytes().split(b"\n") if len(offsets) > 1 else []
+    if offsets[-1] == 0:  # an empty file cannot be mapped
+        seq = np.zeros(0, dtype=np.uint8)
+    else:
+        seq = np.asarray(np.memmap(seqname, dtype=np.uint8, mode="r"))
+    return headers, offsets, seq
+
+
+def fasta_items(filename, buffers=None):
+    """
+    generator function that yields each (header, sequence) pair from a FASTA file
+    (gzip-compressed if its name ends with .gz).
     Header is given as an immutable 'bytes' object;
-    sequence is given as a mutable numpy array of dtype uint8.
+    sequence is given as a numpy array of dtype uint8,
+    a read-only view into the binary cache if the file has an up-to-date one,
+    and a mutable array otherwise.
+    Given a list of reusable uint8 arrays as buffers, parsed sequences are
+    views of these arrays, used in turn (each is overwritten len(buffers) records later).
     """
-    with open(filename, "rb") as f:
+    cache = load_genome_cache(filename)
+    if cache is not None:
+        headers, offsets, seq = cache
+        for (i, header) in enumerate(headers):
+            yield (header, seq[offsets[i]:offsets[i+1]])
+        return
+    with _open_fasta(filename) as f:
+        if buffers is not None:
+            yield from _fasta_reads_into(f, buffers)
+            return
         for (header, seq) in _fasta_reads_from_filelike(f):
             yield (header, np.frombuffer(seq, dtype=np.uint8))
 
+
+def fasta_intervals(filename, minrun=0, masked=False, buffers=None):
+    """
+    generator function that yields (header, sequence, intervals) from a FASTA file,
+    like fasta_items, where intervals is the index of informative intervals
+    of the sequence computed by informative_intervals(sequence, minrun, masked).
+    """
+    for (header, seq) in fasta_items(filename, buffers):
+        yield (header, seq, informative_intervals(seq, minrun, masked))
+
+
+# 2-bit packed DNA:
+# words holds 32 bases per uint64 (base p in bits 2*(p % 32) and 2*(p % 32)+1;
+# A=0, C=1, G=2, T=3). Everything else is rare in assemblies and stored separately:
+# lower: (start, stop) runs of lowercase (soft-masked) bytes;
+# exceptions: (start, stop, byte) runs of one byte other than ACGT/acgt,
+# stored in upper case (N for n) and encoded as A in words.
+
+PackedDNA = collections.namedtuple("PackedDNA", ["words", "n", "lower", "exceptions"])
+
+_CODE = np.full(256, 252, dtype=np.uint8)  # 2-bit code of each byte, | 4 for acgt; 252: exception
+for (_code, _letters) in enumerate((b"Aa", b"Cc", b"Gg", b"Tt")):
+    _CODE[_letters[0]], _CODE[_letters[1]] = _code, _code | 4
+
+
+@njit(nogil=True)
+def _pack_runs(seq, code, irregular, lower, exceptions):
+    """
+    internal function that finds the lowercase and exception runs
+    in the given irregular words of seq; only counts them if the arrays are too small.
+    Return the numbers of lowercase and exception runs.
+    """
+    n = len(seq)
+    fill = len(lower) > 0 or len(exceptions) > 0
+    il = ie = -1
+    inlower, prev = False, -1  # previous byte lowercase? previous exception byte (-1: none)
+    for (idx, i) in enumerate(irregular):
+        if idx > 0 and irregular[idx-1] != i - 1:  # runs end at regular words
+            inlower, prev = False, -1
+        for p in range(32 * i, min(n, 32 * i + 32)):
+            c = seq[p]
+            islower = 97 <= c <= 122
+            if islower:
+                if not inlower:
+                    il += 1
+                    if fill: lower[il, 0] = p
+                if fill: lower[il, 1] = p + 1
+            inlower = islower
+            if code[c] == 252:
+                u = c - 32 if islower else c
+                if u != prev:
+                    ie += 1
+                    if fill: exceptions[ie, 0], exceptions[ie, 2] = p, u
+                if fill: exceptions[ie, 1] = p + 1
+                prev = u
+            else:
+                prev = -1
+    return il + 1, ie + 1
+
+
+@njit(nogil=True, locals=dict(w="uint64", bad="uint8"))
+def _pack_2bit(seq, code):
+    """internal function that returns (words, lower, exceptions) of seq"""
+    n = len(seq)
+    nw = (n + 31) // 32
+    words = np.empty(nw, dtype=np.uint64)
+    irregular = np.empty(nw, dtype=np.int64)  # words with lowercase or exception bytes
+    ni = 0
+    for i in range(nw):
+        w, bad = 0, 0
+        if 32 * i + 32 <= n:
+            for j in range(32):  # a full word: constant trip count
+                x = code[seq[32 * i + j]]
+                bad |= x
+                w |= uint64(x & 3) << uint64(2 * j)
+        else:
+            for j in range(n - 32 * i):
+                x = code[seq[32 * i + j]]
+                bad |= x
+                w |= uint64(x & 3) << uint64(2 * j)
+        words[i] = w
+        if bad & 252:
+            irregular[ni] = i
+            ni += 1
+    irregular = irregular[:ni]
+    nlower, nexc = _pack_runs(seq, code, irregular,
+        np.empty((0, 2), dtype=np.int64), np.empty((0, 3), dtype=np.int64))
+    lower = np.empty((nlower, 2), dtype=np.int64)
+    exceptions = np.empty((nexc, 3), dtype=np.int64)
+    if nlower > 0 or nexc > 0:
+        _pack_runs(seq, code, irregular, lower, exceptions)
+    return words, lower, exceptions
+
+
+def pack_2bit(seq):
+    """
+    Pack a DNA sequence (uint8 array) into a PackedDNA of about a quarter of its size;
+    unpack_2bit restores it byte for byte.
+    """
+    words, lower, exceptions = _pack_2bit(seq, _CODE)
+    return PackedDNA(words, len(seq), lower, exceptions)
+
+
+@njit(nogil=True)
+def _unpack_2bit(words, lower, exceptions, start, stop):
+    """internal function that returns bytes start..stop-1 of a packed sequence"""
+    letters = np.frombuffer(b"ACGT", dtype=np.uint8)
+    out = np.empty(stop - start, dtype=np.uint8)
+    for p in range(start, stop):
+        out[p - start] = letters[(words[p >> 5] >> uint64(2 * (p & 31))) & uint64(3)]
+    i = np.searchsorted(exceptions[:, 1], start, side="right")
+    while i < len(exceptions) and exceptions[i, 0] < stop:
+        out[max(exceptions[i, 0], start) - start:min(exceptions[i, 1], stop) - start] = exceptions[i, 2]
+        i += 1
+    i = np.searchsorted(lower[:, 1], start, side="right")
+    while i < len(lower) and lower[i, 0] < stop:
+        for p in range(max(lower[i, 0], start), min(lower[i, 1], stop)):
+            out[p - start] |= 32  # lower case
+        i += 1
+    return out
+
+
+def unpack_2bit(packed, start=0, stop=None):
+    """return the bytes start..stop-1 of a PackedDNA as a uint8 array"""
+    stop = packed.n if stop is None else stop
+    return _unpack_2bit(packed.words, packed.lower, packed.exceptions, start, stop)
+
+
+def fasta_packed(filename):
+    """
+    generator function that yields each (header, PackedDNA) pair from a FASTA file;
+    only one record is held unpacked at a time.
+    """
+    for (header, seq) in fasta_items(filename):
+        yield (header, pack_2bit(seq))
+
+
+@njit(nogil=True)
+def informative_intervals(seq, minrun=0, masked=False):
+    """
+    Return the informative intervals of seq as an int64 array of (start, stop) rows:
+    the parts outside of runs of at least minrun N/n bytes (none if minrun=0)
+    and, if masked, outside of soft-masked (lowercase) runs, including
+    shorter N/n runs that contain a lowercase n.
+    """
+    n = len(seq)
+    intervals = np.empty((n // 2 + 1, 2), dtype=np.int64)  # informative runs alternate with gaps
+    k = 0
+    if not masked and minrun > 0:
+        # A run of >= minrun N's that starts in [i, i + minrun) covers i + minrun - 1,
+        # so probing every minrun-th byte finds all of them.
+        start = 0  # start of the current informative interval
+        i = 0
+        while i + minrun <= n:
+            probe = i + minrun - 1
+            c = seq[probe]
+            if c != 78 and c != 110:
+                i += minrun
+                continue
+            a, b = probe, probe + 1
+            while a > i and (seq[a-1] == 78 or seq[a-1] == 110):
+                a -= 1
+            while b < n and (seq[b] == 78 or seq[b] == 110):
+                b += 1
+            if b - a >= minrun:
+                if a > start:
+                    intervals[k, 0], intervals[k, 1] = start, a
+                    k += 1
+                start = b
+            i = b
+        if start < n:
+            intervals[k, 0], intervals[k, 1] = start, n
+            k += 1
+        return intervals[:k].copy()
+    start = -1  # start of the current informative interval
+    i = 0
+    while i < n:
+        c = seq[i]
+        j = i + 1
+        skip = False
+        if minrun > 0 and (c == 78 or c == 110):  # N or n
+            lower = c == 110
+            while j < n and (seq[j] == 78 or seq[j] == 110):
+                lower = lower or seq[j] == 110
+                j += 1
+            # with masked, a shorter run is skipped as a whole if it is partly soft-masked
+            skip = j - i >= minrun or (masked and lower)
+        elif masked and 97 <= c <= 122:  # a..z
+            while j < n and 97 <= seq[j] <= 122 and (minrun == 0 or seq[j] != 110):
+                j += 1
+            skip = True
+        if skip and start >= 0:
+            intervals[k, 0], intervals[k, 1] = start, i
+            k += 1
+            start = -1
+        elif not skip and start < 0:
+            start = i
+        i = j
+    if start >= 0:
+        intervals[k, 0], intervals[k, 1] = start, n
+        k += 1
+    return intervals[:k].copy()
+
 # build nfas
 
 @njit
@@ -40,8 +487,8 @@ def build_nfa_and(P):
     """Build an NFA from a pattern"""
     mask = np.zeros(256, dtype=np.uint64)  # one mask for each byte 0..255
     for bit, a in enumerate(P):
-        mask[a] |= uint64(1 << bit)
-    accept = (1 << (len(P)-1))
+        mask[a] |= uint64(1) << uint64(bit)
+    accept = uint64(1) << uint64(len(P)-1)
     return mask, accept
 
 
@@ -57,8 +504,17 @@ def build_nfa_or(P):
 
 # matchings
 
-@njit(locals=dict(k=uint64, A=uint64, p=uint64, c=uint8))
-def shift_and(mask, accept, text, results):
+# Resumable scanning: every kernel takes an optional uint64 array 'state'.
+# Without it, the kernel scans the whole text, stores the first results.size
+# end positions and returns the total number of matches.
+# With it, the kernel stops as soon as 'results' is full and saves its
+# registers in 'state', so that the next call continues where it stopped;
+# state[0] is the next text position (0: start from the beginning).
+# A state array of size 2 + 2 * W is large enough for every kernel
+# (W: number of mask words); see iter_results.
+
+@njit(nogil=True, locals=dict(k="uint64", A="uint64", p="uint64", c="uint8"))
+def shift_and(mask, accept, text, results, state=None):
     """
     just-in-time compiled version of the Shift-And matcher
     that writes end positions of matches into an array 'results'
@@ -67,16 +523,25 @@ def shift_and(mask, accept, text, results):
     k=0
     N = results.size
     A = 0
-    for p, c in enumerate(text):
+    start = 0
+    if state is not None and state[0] > 0:
+        start, A = state[0], state[1]
+    for p in range(start, len(text)):
+        c = text[p]
         A = ((A << 1) | 1) & mask[c]
         if A & accept:  # test whether accept bit is nonzero
             if k < N: results[k] = p
             k += 1
+            if state is not None and k == N:
+                state[0], state[1] = p + 1, A
+                return k
+    if state is not None:
+        state[0], state[1] = len(text), A
     return k
 
 
-@njit(locals=dict(k=uint64, A=uint64, p=uint64, c=uint8))
-def shift_or(mask, accept, text, results):
+@njit(nogil=True, locals=dict(k="uint64", A="uint64", p="uint64", c="uint8"))
+def shift_or(mask, accept, text, results, state=None):
     """
     just-in-time compiled version of the Shift-Or matcher
     that writes end positions of matches into an array 'results'
@@ -85,16 +550,25 @@ def shift_or(mask, accept, text, results):
     k = 0
     N = results.size
     A = uint64(-1)  # all bits set
-    for p, c in enumerate(text):
+    start = 0
+    if state is not None and state[0] > 0:
+        start, A = state[0], state[1]
+    for p in range(start, len(text)):
+        c = text[p]
         A = (A << 1) | mask[c]
         if A & accept == 0:  # test whether accept bit is zero
             if k < N: results[k] = p
             k += 1
+            if state is not None and k == N:
+                state[0], state[1] = p + 1, A
+                return k
+    if state is not None:
+        state[0], state[1] = len(text), A
     return k
 
-@njit(locals=dict(accept_state=uint64, k=uint64,
-    m=uint64, n=uint64, pos=uint64))
-def bndm(masks, accept_state, T, results):
+@njit(nogil=True, locals=dict(accept_state="uint64", k="uint64",
+    m="uint64", n="uint64", pos="uint64", A="uint64"))
+def bndm(masks, accept_state, T, results, state=None):
     """
     Input:
     masks: Array with 256 slots of uint64
@@ -108,6 +582,8 @@ def bndm(masks, accept_state, T, results):
     N = results.size
     pattern_length = int(np.log2(accept_state)+1)
     n, m, pos = len(T), pattern_length, pattern_length
+    if state is not None and state[0] > 0:
+        pos = state[0]  # end of the next window
 
     """
     TODO: Implement the bndm algorithm as described on the slides.
@@ -117,60 +593,1254 @@ def bndm(masks, accept_state, T, results):
     - Run: python assignment04.py --fasta ecoli-genome.fasta -P ACGTAGCTA -a bndm
     """
     while pos <= n:
-      j, lastsuffix, A = 1, 0, (1 << m) - 1
+      j, lastsuffix, A = 1, 0, ~uint64(0) >> (64 - m)  # m ones, also for m = 64
       while A != 0:
         A &= masks[T[pos-j]]
         if A & accept_state != 0:
           if j == m:
-            results[k] = pos - 1 #adding the end index of matching pattern in the results
+            if k < N: results[k] = pos - 1 #adding the end index of matching pattern in the results
             k = k + 1       
             break
           else:
             lastsuffix = j
         j += 1; A = A << 1
       pos += m - lastsuffix    
+      if state is not None and k == N:
+        state[0] = pos
+        return k
     
+    if state is not None:
+        state[0] = pos
+    return k
+
+# multi-word variants for patterns longer than 64:
+# bit b of a mask or state is bit b % 64 of word b // 64,
+# so masks have shape (256, W) with W = ceil(m / 64);
+# the accept bit is always in the last word, so 'accept' is that word's bit.
+
+@njit
+def build_nfa_and_multi(P):
+    """Build a multi-word NFA from a pattern of any length"""
+    W = max(1, (len(P) + 63) // 64)
+    mask = np.zeros((256, W), dtype=np.uint64)
+    for bit, a in enumerate(P):
+        mask[a, bit // 64] |= uint64(1) << uint64(bit % 64)
+    accept = uint64(1) << uint64((len(P) - 1) % 64)
+    return mask, accept
+
 
+@njit
+def build_nfa_or_multi(P):
+    """Build an "inverse" multi-word NFA from a pattern of any length"""
+    mask, accept = build_nfa_and_multi(P)
+    for a in range(256):
+        for w in range(mask.shape[1]):
+            mask[a, w] = ~mask[a, w]
+    return mask, accept
+
+
+@njit(nogil=True, locals=dict(k="uint64", x="uint64", carry="uint64", p="uint64", c="uint8"))
+def shift_and_multi(mask, accept, text, results, state=None):
+    """
+    Shift-And matcher with multi-word state vectors;
+    same conventions as shift_and.
+    """
+    k = 0
+    N = results.size
+    W = mask.shape[1]
+    A = np.zeros(W, dtype=np.uint64)
+    start = 0
+    if state is not None and state[0] > 0:
+        start = state[0]
+        A[:] = state[1:W+1]
+    for p in range(start, len(text)):
+        c = text[p]
+        carry = 1  # the bit shifted into word 0 starts a new match
+        for w in range(W):
+            x = A[w]
+            A[w] = ((x << 1) | carry) & mask[c, w]
+            carry = x >> 63
+        if A[W-1] & accept:
+            if k < N: results[k] = p
+            k += 1
+            if state is not None and k == N:
+                state[0] = p + 1
+                state[1:W+1] = A
+                return k
+    if state is not None:
+        state[0] = len(text)
+        state[1:W+1] = A
     return k
 
-def main(args):
-    alg = args.algorithm
-    P = args.pattern.encode("ASCII")
 
+@njit(nogil=True, locals=dict(k="uint64", x="uint64", carry="uint64", p="uint64", c="uint8"))
+def shift_or_multi(mask, accept, text, results, state=None):
+    """
+    Shift-Or matcher with multi-word state vectors;
+    same conventions as shift_or.
+    """
+    k = 0
+    N = results.size
+    W = mask.shape[1]
+    A = np.full(W, uint64(-1), dtype=np.uint64)  # all bits set
+    start = 0
+    if state is not None and state[0] > 0:
+        start = state[0]
+        A[:] = state[1:W+1]
+    for p in range(start, len(text)):
+        c = text[p]
+        carry = 0
+        for w in range(W):
+            x = A[w]
+            A[w] = (x << 1) | carry | mask[c, w]
+            carry = x >> 63
+        if A[W-1] & accept == 0:
+            if k < N: results[k] = p
+            k += 1
+            if state is not None and k == N:
+                state[0] = p + 1
+                state[1:W+1] = A
+                return k
+    if state is not None:
+        state[0] = len(text)
+        state[1:W+1] = A
+    return k
+
+
+@njit(nogil=True, locals=dict(k="uint64", m="uint64", n="uint64", pos="uint64", j="uint64",
+    lastsuffix="uint64", x="uint64", carry="uint64", alive="uint64"))
+def bndm_multi(masks, accept_state, T, results, state=None):
+    """
+    BNDM with multi-word state vectors;
+    masks are built from the reversed pattern, as for bndm.
+    """
+    k = 0
+    N = results.size
+    W = masks.shape[1]
+    m = 64 * (W - 1) + int(np.log2(accept_state)) + 1
+    n = len(T)
+    top = ~uint64(0) >> uint64(64 * W - m)  # valid bits of the last word
+    A = np.empty(W, dtype=np.uint64)
+    pos = m
+    if state is not None and state[0] > 0:
+        pos = state[0]  # end of the next window
+    while pos <= n:
+        j, lastsuffix = 1, 0
+        A[:] = ~uint64(0)
+        A[W-1] = top
+        alive = 1
+        while alive:
+            c = T[pos-j]
+            alive = 0
+            for w in range(W):
+                A[w] &= masks[c, w]
+                alive |= A[w]
+            if A[W-1] & accept_state != 0:
+                if j == m:
+                    if k < N: results[k] = pos - 1
+                    k += 1
+                    break
+                else:
+                    lastsuffix = j
+            j += 1
+            carry = 0
+            for w in range(W):
+                x = A[w]
+                A[w] = (x << 1) | carry
+                carry = x >> 63
+        pos += m - lastsuffix
+        if state is not None and k == N:
+            state[0] = pos
+            return k
+    if state is not None:
+        state[0] = pos
+    return k
+
+
+# approximate matching
+
+@njit(nogil=True, locals=dict(kk="uint64", Pv="uint64", Mv="uint64", Eq="uint64", Xv="uint64", Xh="uint64",
+    Ph="uint64", Mh="uint64", high="uint64", p="uint64", c="uint8"))
+def myers(peq, accept, k, text, results, distances, state=None):
+    """
+    just-in-time compiled version of Myers' bit-vector algorithm
+    for approximate matching with edit distance at most k,
+    using blocks of 64 rows for patterns of any length.
+    peq and accept are built by build_nfa_and_multi from the pattern.
+    Writes end positions of matches into an array 'results',
+    their edit distances into 'distances',
+    and returns the number of matches.
+    """
+    kk = 0
+    N = results.size
+    W = peq.shape[1]
+    m = 64 * (W - 1) + int(np.log2(accept)) + 1
+    P = np.full(W, ~uint64(0), dtype=np.uint64)  # vertical +1 deltas
+    M = np.zeros(W, dtype=np.uint64)             # vertical -1 deltas
+    score = m
+    start = 0
+    if state is not None and state[0] > 0:
+        start, score = state[0], int64(state[1])
+        P[:] = state[2:W+2]
+        M[:] = state[W+2:2*W+2]
+    if W == 1:  # single-word fast path without block bookkeeping
+        Pv, Mv = P[0], M[0]
+        for p in range(start, len(text)):
+            c = text[p]
+            Eq = peq[c, 0]
+            Xv = Eq | Mv
+            Xh = (((Eq & Pv) + Pv) ^ Pv) | Eq
+            Ph = Mv | ~(Xh | Pv)
+            Mh = Pv & Xh
+            if Ph & accept:
+                score += 1
+            elif Mh & accept:
+                score -= 1
+            Ph <<= 1
+            Mh <<= 1
+            Pv = Mh | ~(Xv | Ph)
+            Mv = Ph & Xv
+            if score <= k:
+                if kk < N:
+                    results[kk] = p
+                    distances[kk] = score
+                kk += 1
+                if state is not None and kk == N:
+                    state[0], state[1], state[2], state[3] = p + 1, score, Pv, Mv
+                    return kk
+        if state is not None:
+            state[0], state[1], state[2], state[3] = len(text), score, Pv, Mv
+        return kk
+    for p in range(start, len(text)):
+        c = text[p]
+        hin = 0  # the top row is all zeros: a match may start anywhere
+        for b in range(W):
+            high = accept if b == W - 1 else uint64(1) << uint64(63)
+            Pv, Mv = P[b], M[b]
+            Eq = peq[c, b]
+            Xv = Eq | Mv
+            if hin < 0:
+                Eq |= 1
+            Xh = (((Eq & Pv) + Pv) ^ Pv) | Eq
+            Ph = Mv | ~(Xh | Pv)
+            Mh = Pv & Xh
+            hout = 0
+            if Ph & high:
+                hout = 1
+            elif Mh & high:
+                hout = -1
+            Ph <<= 1
+            Mh <<= 1
+            if hin < 0:
+                Mh |= 1
+            elif hin > 0:
+                Ph |= 1
+            P[b] = Mh | ~(Xv | Ph)
+            M[b] = Ph & Xv
+            hin = hout
+        score += hin
+        if score <= k:
+            if kk < N:
+                results[kk] = p
+                distances[kk] = score
+            kk += 1
+            if state is not None and kk == N:
+                _myers_save(state, p + 1, score, P, M)
+                return kk
+    if state is not None:
+        _myers_save(state, len(text), score, P, M)
+    return kk
+
+
+@njit(nogil=True)
+def _myers_save(state, pos, score, P, M):
+    W = P.size
+    state[0], state[1] = pos, score
+    state[2:W+2] = P
+    state[W+2:2*W+2] = M
+
+
+# skip-based matchers for long patterns:
+# they slide a window of length m over the text, read it from right to left,
+# and shift it by more than one position where possible.
+# state[0] is the start of the next window (as for bndm, state[0] = 0 is a fresh start).
+
+@njit
+def build_horspool(P):
+    """
+    Return (pattern, shift) for Horspool's algorithm:
+    pattern as uint8 array, shift[a] is the distance from the last occurrence
+    of byte a in P[:-1] to the end of P (m for bytes that do not occur).
+    """
+    m = len(P)
+    pattern = np.empty(m, dtype=np.uint8)
+    shift = np.full(256, m, dtype=np.int64)
+    for i in range(m):
+        pattern[i] = P[i]
+    for i in range(m - 1):
+        shift[P[i]] = m - 1 - i
+    return pattern, shift
+
+
+@njit(nogil=True)
+def horspool(pattern, shift, text, results, state=None):
+    """
+    just-in-time compiled version of Horspool's algorithm
+    that writes end positions of matches into an array 'results'
+    and returns the number of matches.
+    """
+    k = 0
+    N = results.size
+    n, m = len(text), len(pattern)
+    pos = 0
+    if state is not None and state[0] > 0:
+        pos = int64(state[0])
+    while pos <= n - m:
+        last = text[pos + m - 1]
+        if last == pattern[m - 1]:
+            j = m - 2
+            while j >= 0 and text[pos + j] == pattern[j]:
+                j -= 1
+            if j < 0:
+                if k < N: results[k] = pos + m - 1
+                k += 1
+        pos += shift[last]
+        if state is not None and k == N:
+            state[0] = pos
+            return k
+    if state is not None:
+        state[0] = pos
+    return k
+
+
+@njit
+def build_oracle(P):
+    """
+    Return (delta, delta2) for BOM and EBOM:
+    delta is the (m+1, 256) transition table of the factor oracle
+    of the reversed pattern (-1: no transition);
+    delta2[a, b] is the state after reading a, then b, from state 0.
+    """
+    m = len(P)
+    delta = np.full((m + 1, 256), -1, dtype=np.int32)
+    supply = np.empty(m + 1, dtype=np.int32)
+    supply[0] = -1
+    for i in range(1, m + 1):
+        a = P[m - i]  # the i-th character of the reversed pattern
+        delta[i - 1, a] = i
+        s = supply[i - 1]
+        while s > -1 and delta[s, a] == -1:
+            delta[s, a] = i
+            s = supply[s]
+        supply[i] = 0 if s == -1 else delta[s, a]
+    delta2 = np.full((256, 256), -1, dtype=np.int32)
+    for a in range(256):
+        q = delta[0, a]
+        if q != -1:
+            for b in range(256):
+                delta2[a, b] = delta[q, b]
+    return delta, delta2
+
+
+@njit(nogil=True)
+def bom(delta, delta2, text, results, state=None):
+    """
+    just-in-time compiled version of Backward Oracle Matching (BOM)
+    that writes end positions of matches into an array 'results'
+    and returns the number of matches.
+    """
+    k = 0
+    N = results.size
+    n, m = len(text), delta.shape[0] - 1
+    pos = 0
+    if state is not None and state[0] > 0:
+        pos = int64(state[0])
+    while pos <= n - m:
+        q, j = 0, m - 1
+        while j >= 0:
+            q = delta[q, text[pos + j]]
+            if q == -1:
+                break
+            j -= 1
+        if j < 0:  # the only word of length m in the oracle is the pattern
+            if k < N: results[k] = pos + m - 1
+            k += 1
+            pos += 1
+        else:
+            pos += j + 1
+        if state is not None and k == N:
+            state[0] = pos
+            return k
+    if state is not None:
+        state[0] = pos
+    return k
+
+
+@njit(nogil=True)
+def ebom(delta, delta2, text, results, state=None):
+    """
+    just-in-time compiled version of Extended BOM (patterns of length >= 2):
+    BOM with the first two transitions of each window in one lookup,
+    and a fast loop that skips m-1 positions while the last two
+    characters of the window are no factor of the pattern.
+    """
+    k = 0
+    N = results.size
+    n, m = len(text), delta.shape[0] - 1
+    pos = 0
+    if state is not None and state[0] > 0:
+        pos = int64(state[0])
+    while pos <= n - m:
+        q = delta2[text[pos + m - 1], text[pos + m - 2]]
+        while q == -1:
+            pos += m - 1
+            if pos > n - m:
+                break
+            q = delta2[text[pos + m - 1], text[pos + m - 2]]
+        if q == -1:
+            break
+        j = m - 3
+        while j >= 0:
+            q = delta[q, text[pos + j]]
+            if q == -1:
+                break
+            j -= 1
+        if j < 0:
+            if k < N: results[k] = pos + m - 1
+            k += 1
+            pos += 1
+        else:
+            pos += j + 1
+        if state is not None and k == N:
+            state[0] = pos
+            return k
+    if state is not None:
+        state[0] = pos
+    return k
+
+
+# packed multi-pattern Shift-And:
+# several short patterns share one uint64 word; each occupies a run of bits
+# from its init bit (first character) to its accept bit (last character).
+# Shifting the accept bit of one pattern into the init bit of the next one
+# is harmless, because init bits are set in every step anyway.
+
+def build_nfa_packed(Ps):
+    """
+    Pack patterns (each at most 64 long) into words by first-fit decreasing.
+    Return (mask, init, accept, patid):
+    mask: (256, W) uint64 masks; init, accept: (W,) uint64 init and accept bits;
+    patid: (W, 64) int32 array, the pattern index of each accept bit.
+    """
+    words = []  # per word: list of pattern indices
+    used = []   # per word: number of used bits
+    for i in sorted(range(len(Ps)), key=lambda i: -len(Ps[i])):
+        m = len(Ps[i])
+        if not 0 < m <= 64:
+            raise ValueError(f"pattern {i} has length {m}, packed patterns need length 1..64")
+        for w in range(len(words)):
+            if used[w] + m <= 64:
+                break
+        else:
+            w = len(words)
+            words.append([]); used.append(0)
+        words[w].append(i)
+        used[w] += m
+    W = len(words)
+    mask = np.zeros((256, W), dtype=np.uint64)
+    init = np.zeros(W, dtype=np.uint64)
+    accept = np.zeros(W, dtype=np.uint64)
+    patid = np.full((W, 64), -1, dtype=np.int32)
+    for (w, indices) in enumerate(words):
+        bit = 0
+        for i in indices:
+            init[w] |= np.uint64(1) << np.uint64(bit)
+            for a in Ps[i]:
+                mask[a, w] |= np.uint64(1) << np.uint64(bit)
+                bit += 1
+            accept[w] |= np.uint64(1) << np.uint64(bit - 1)
+            patid[w, bit - 1] = i
+    return mask, init, accept, patid
+
+
+@njit(nogil=True, locals=dict(k="uint64", x="uint64", hits="uint64", low="uint64", p="uint64", c="uint8"))
+def shift_and_packed(mask, init, accept, patid, text, results, state=None):
+    """
+    just-in-time compiled packed multi-pattern Shift-And matcher
+    that writes (end_position, pattern_index) pairs into the rows
+    of an array 'results' of shape (N, 2) and returns the number of matches.
+    One pass over the text costs O(n * W) word operations for W packed words.
+    With 'state', all matches of one position are reported together,
+    so N must be at least the number of patterns.
+    """
+    k = 0
+    N = results.shape[0]
+    W = mask.shape[1]
+    A = np.zeros(W, dtype=np.uint64)
+    start = 0
+    if state is not None and state[0] > 0:
+        start = state[0]
+        A[:] = state[1:W+1]
+    for p in range(start, len(text)):
+        c = text[p]
+        if state is not None:
+            # stop before a position whose matches do not fit anymore
+            hits = 0
+            for w in range(W):
+                x = ((A[w] << 1) | init[w]) & mask[c, w]
+                hits += _popcount(x & accept[w])
+            if k > 0 and k + hits > N:
+                state[0] = p
+                state[1:W+1] = A
+                return k
+        for w in range(W):
+            x = ((A[w] << 1) | init[w]) & mask[c, w]
+            A[w] = x
+            hits = x & accept[w]
+            while hits:
+                low = hits & (~hits + 1)  # lowest set bit
+                if k < N:
+                    results[k, 0] = p
+                    results[k, 1] = patid[w, int(np.log2(low))]
+                k += 1
+                hits ^= low
+    if state is not None:
+        state[0] = len(text)
+        state[1:W+1] = A
+    return k
+
+
+@njit(nogil=True, locals=dict(x="uint64"))
+def _popcount(x):
+    """number of set bits in a uint64"""
+    n = 0
+    while x:
+        x &= x - uint64(1)
+        n += 1
+    return n
+
+
+def precompile():
+    """
+    Compile the kernels eagerly for the argument types used by main
+    (writable texts and read-only texts from the genome cache, with resume state)
+    into numba's on-disk cache, for example once after installation.
+    """
+    _load_kernels()
+    from numba import typeof, types
+    u8, u64 = typeof(np.zeros(1, dtype=np.uint8)), typeof(np.zeros(1, dtype=np.uint64))
+    u64_2d, i32_2d = typeof(np.zeros((1, 1), dtype=np.uint64)), typeof(np.zeros((1, 1), dtype=np.int32))
+    for build in (build_nfa_and, build_nfa_or, build_nfa_and_multi, build_nfa_or_multi,
+            build_horspool, build_oracle):
+        build.compile((typeof(b""),))
+    for text in (u8, u8.copy(readonly=True)):
+        for kernel in (shift_and, shift_or, bndm):
+            kernel.compile((u64, types.uint64, text, u64, u64))
+        for kernel in (shift_and_multi, shift_or_multi, bndm_multi):
+            kernel.compile((u64_2d, types.uint64, text, u64, u64))
+        myers.compile((u64_2d, types.uint64, types.int64, text, u64, u64, u64))
+        horspool.compile((u8, typeof(np.zeros(1, dtype=np.int64)), text, u64, u64))
+        for kernel in (bom, ebom):
+            kernel.compile((i32_2d, i32_2d, text, u64, u64))
+        shift_and_packed.compile((u64_2d, u64, u64, i32_2d, text, u64_2d, u64))
+        informative_intervals.compile((text, types.int64, types.boolean))
+        _pack_2bit.compile((text, u8))
+    i64, i64_2d = typeof(np.zeros(1, dtype=np.int64)), typeof(np.zeros((1, 1), dtype=np.int64))
+    for kernel in (shift_and_2bit, bndm_2bit):
+        kernel.compile((u64, types.uint64, u64, types.int64, types.int64, u64, u64))
+    _unpack_2bit.compile((u64, i64_2d, i64_2d, types.int64, types.int64))
+    _irregular_blocks.compile((i64_2d, i64_2d, types.int64))
+
+
+def iter_results(find_matches, nfa, text, *buffers):
+    """
+    Call the resumable kernel find_matches(*nfa, text, *buffers, state)
+    until it has scanned the whole text, and yield the number of results
+    written into the buffers by each call.
+    The buffers are overwritten by the next call, so consume them first.
+    """
+    state = _new_state(nfa)
+    while True:
+        k = find_matches(*nfa, text, *buffers, state)
+        if k == 0:  # kernels only return early with a full buffer
+            break
+        yield k
+
+
+def _new_state(nfa):
+    """internal function that returns a fresh state array for the kernels of nfa"""
+    mask = nfa[0]
+    W = mask.shape[1] if mask.ndim == 2 else 1
+    return np.zeros(2 + 2 * W, dtype=np.uint64)
+
+
+def iter_matches(find_matches, nfa, text, *buffers, first=1):
+    """
+    Lazily yield the matches of the resumable kernel find_matches in text,
+    one by one: end positions, or tuples (one entry per buffer, or per column
+    of a single 2-d buffer).
+    The first kernel call stops after 'first' matches, and each further call
+    after twice as many (up to the buffer size), so a caller that only takes
+    the first few matches (or asks whether there is one) only pays for
+    the text prefix that contains them.
+    (For shift_and_packed, 'first' must be at least the number of patterns.)
+    """
+    state = _new_state(nfa)
+    limit = first
+    while True:
+        views = [b[:limit] for b in buffers]
+        k = find_matches(*nfa, text, *views, state)
+        if k == 0:
+            break
+        found = [v[:k].tolist() for v in views]
+        if len(found) > 1:
+            yield from zip(*found)
+        elif views[0].ndim > 1:
+            yield from map(tuple, found[0])  # rows of a 2-d buffer
+        else:
+            yield from found[0]
+        limit = min(2 * limit, len(buffers[0]))
+
+
+def _scan_window(find_matches, nfa, text, start, lo, hi, buffers):
+    """
+    internal function that scans text[start:hi] with a resumable kernel
+    and returns the results (one array per buffer) of the matches ending in [lo, hi),
+    with end positions relative to text
+    """
+    buffers = [np.empty_like(b) for b in buffers]  # one set per thread
+    pieces = [[] for b in buffers]
+    for k in iter_results(find_matches, nfa, text[start:hi], *buffers):
+        for (piece, b) in zip(pieces, buffers):
+            piece.append(b[:k].copy())
+    found = [np.concatenate(piece) if piece else b[:0].copy() for (piece, b) in zip(pieces, buffers)]
+    ends = found[0] if found[0].ndim == 1 else found[0][:, 0]  # a view
+    ends += start
+    keep = ends >= lo  # drop matches found again at the boundary
+    return [f[keep] for f in found]
+
+
+def parallel_results(find_matches, nfa, text, overlap, *buffers, threads=None, chunksize=1 << 22,
+        intervals=None):
+    """
+    Scan text with the resumable kernel find_matches on a pool of threads
+    (the kernels release the GIL). The text is cut into windows of
+    chunksize + overlap bytes, where overlap must be at least the
+    maximal length of a match minus 1. The buffers only give the shapes
+    and types of the results.
+    If intervals (rows of (start, stop)) are given, only these parts of the text
+    are scanned, and no window extends beyond its interval.
+    Yield the results of each window (one array per buffer) in text order;
+    at most twice as many windows as threads are scanned or waiting
+    to be yielded at a time, so memory does not grow with the text.
+    """
+    intervals = [(0, len(text))] if intervals is None else np.asarray(intervals).tolist()
+    bounds = ((max(a, lo - overlap), lo, min(lo + chunksize, b))
+        for (a, b) in intervals for lo in range(a, b, chunksize))
+    workers = threads or min(32, (os.cpu_count() or 1) + 4)  # the default of ThreadPoolExecutor
+    with ThreadPoolExecutor(workers) as pool:
+        pending = collections.deque()  # futures of the windows in text order
+        for w in bounds:
+            pending.append(pool.submit(_scan_window, find_matches, nfa, text, *w, buffers))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# pipelined driver:
+# reading (parsing or decompressing) a record, scanning it and writing the
+# results run in three threads connected by bounded queues, so that parsing
+# the next record and formatting the results of the last one overlap with
+# the scan of the current one (the kernels release the GIL).
+
+_DONE = object()  # marks the end of the items of a stage
+
+
+def _put(q, item, stop):
+    """internal function that puts item into the bounded queue q; False if the event stop is set first"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.05)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    """internal function that gets an item from the queue q; _DONE if the event stop is set first"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.05)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _timed(items, timing, stage):
+    """internal generator that yields the items of an iterable and adds the time to produce them to timing[stage]"""
+    items = iter(items)
+    while True:
+        t0 = time.perf_counter()
+        item = next(items, _DONE)
+        timing[stage] += time.perf_counter() - t0
+        if item is _DONE:
+            return
+        yield item
+
+
+def pipeline(records, scan, write, depth=2):
+    """
+    Run a search as a pipeline of three stages: a reader thread takes the items
+    of the iterable records (which parses them), the calling thread passes each
+    to the generator function scan, and a writer thread calls write on each item
+    that scan yields. The stages are connected by queues of at most depth items,
+    so the reader is at most depth + 1 records ahead of the scan.
+    An exception in one stage stops the others and is raised.
+    Return the seconds spent in each stage ('read', 'scan', 'write'),
+    waiting for records ('scan waiting'; large if the search is I/O bound)
+    and in total ('wall') as a dict.
+    """
+    timing = dict.fromkeys(("read", "scan", "write", "scan waiting", "wall"), 0.0)
+    inbox, outbox = queue.Queue(depth), queue.Queue(depth)
+    stop = threading.Event()
+
+    def read():
+        try:
+            for record in _timed(records, timing, "read"):
+                if not _put(inbox, record, stop):
+                    return
+            _put(inbox, _DONE, stop)
+        except BaseException:
+            stop.set()
+            raise
+
+    def write_all():
+        try:
+            while True:
+                item = _get(outbox, stop)
+                if item is _DONE:
+                    return
+                t0 = time.perf_counter()
+                write(item)
+                timing["write"] += time.perf_counter() - t0
+        except BaseException:
+            stop.set()
+            raise
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(2) as pool:
+        reader, writer = pool.submit(read), pool.submit(write_all)
+        try:
+            while True:
+                t0 = time.perf_counter()
+                record = _get(inbox, stop)
+                timing["scan waiting"] += time.perf_counter() - t0
+                if record is _DONE:
+                    break
+                for item in _timed(scan(record), timing, "scan"):
+                    if not _put(outbox, item, stop):
+                        break
+            _put(outbox, _DONE, stop)
+        except BaseException:
+            stop.set()
+            raise
+        reader.result()
+        writer.result()
+    timing["wall"] = time.perf_counter() - start
+    return timing
+
+
+def get_kernel(alg, P):
+    """
+    Return (nfa, find_matches) for algorithm alg ('and', 'or', 'bndm', 'myers',
+    'horspool', 'bom', 'ebom') and pattern P (bytes), choosing the multi-word
+    kernels for patterns longer than 64; nfa is the tuple of leading arguments
+    of find_matches (without the error bound k of myers).
+    """
+    multi = len(P) > 64  # single-word kernels hold at most 64 states
     if alg == "and":
-        build_nfa = build_nfa_and
-        find_matches = shift_and
+        build_nfa = build_nfa_and_multi if multi else build_nfa_and
+        find_matches = shift_and_multi if multi else shift_and
     elif alg == "or":
-        build_nfa = build_nfa_or
-        find_matches = shift_or
+        build_nfa = build_nfa_or_multi if multi else build_nfa_or
+        find_matches = shift_or_multi if multi else shift_or
     elif alg == "bndm":
-        build_nfa = lambda x: build_nfa_and(x[::-1])
-        find_matches = bndm
+        build = build_nfa_and_multi if multi else build_nfa_and
+        build_nfa = lambda x: build(x[::-1])
+        find_matches = bndm_multi if multi else bndm
+    elif alg == "myers":
+        build_nfa = build_nfa_and_multi
+        find_matches = myers
+    elif alg == "horspool":
+        return build_horspool(P), horspool
+    elif alg in ("bom", "ebom"):
+        # EBOM reads two characters at once, so it needs m >= 2
+        return build_oracle(P), ebom if alg == "ebom" and len(P) >= 2 else bom
+    else:
+        raise ValueError(f"unknown algorithm '{alg}'")
+    mask, accept = build_nfa(P)
+    return (mask, np.uint64(accept)), find_matches  # accept may exceed int64 (bit 63)
+
+
+# scanning 2-bit packed DNA:
+# the kernels below only see the ACGT codes and are run on the regular
+# segments between 'irregular blocks' (lowercase and exception runs,
+# merged when fewer than m bases apart, so that no match fits in between).
+# A match that overlaps a block is found by the byte kernel on the unpacked
+# block extended by m - 1 bases on both sides. Together this gives exactly
+# the matches of the byte kernels on the unpacked text.
+
+@njit(nogil=True, locals=dict(k="uint64", A="uint64", w="uint64"))
+def shift_and_2bit(mask4, accept, words, lo, hi, results, state=None):
+    """
+    Shift-And on the 2-bit codes at positions lo..hi-1 of a packed sequence,
+    with a 4-entry mask table; same conventions as shift_and
+    (end positions are relative to the whole sequence).
+    """
+    k = 0
+    N = results.size
+    A = 0
+    p = lo
+    if state is not None and state[0] > 0:
+        p, A = int64(state[0]), state[1]
+    while p < hi:
+        w = words[p >> 5] >> uint64(2 * (p & 31))
+        stop = min(hi, (p | 31) + 1)  # end of this word
+        while p < stop:
+            A = ((A << 1) | 1) & mask4[w & 3]
+            w >>= 2
+            if A & accept:
+                if k < N: results[k] = p
+                k += 1
+                if state is not None and k == N:
+                    state[0], state[1] = p + 1, A
+                    return k
+            p += 1
+    if state is not None:
+        state[0], state[1] = p, A
+    return k
+
+
+@njit(nogil=True, locals=dict(k="uint64", accept="uint64", A="uint64"))
+def bndm_2bit(mask4, accept, words, lo, hi, results, state=None):
+    """
+    BNDM on the 2-bit codes at positions lo..hi-1 of a packed sequence,
+    with a 4-entry mask table of the reversed pattern; same conventions as bndm
+    (end positions are relative to the whole sequence).
+    """
+    k = 0
+    N = results.size
+    m = int(np.log2(accept)) + 1
+    pos = lo + m  # end of the window
+    if state is not None and state[0] > 0:
+        pos = int64(state[0])
+    while pos <= hi:
+        j, lastsuffix, A = 1, 0, ~uint64(0) >> uint64(64 - m)
+        while A != 0:
+            q = pos - j
+            A &= mask4[(words[q >> 5] >> uint64(2 * (q & 31))) & uint64(3)]
+            if A & accept != 0:
+                if j == m:
+                    if k < N: results[k] = pos - 1
+                    k += 1
+                    break
+                else:
+                    lastsuffix = j
+            j += 1
+            A = A << uint64(1)
+        pos += m - lastsuffix
+        if state is not None and k == N:
+            state[0] = pos
+            return k
+    if state is not None:
+        state[0] = pos
+    return k
+
+
+@njit(nogil=True)
+def _irregular_blocks(lower, exceptions, m):
+    """
+    internal function that merges the lowercase and exception runs
+    into blocks with gaps of at least m bases; returns (start, stop) rows
+    """
+    runs = np.concatenate((lower[:, :2], exceptions[:, :2]))
+    runs = runs[np.argsort(runs[:, 0], kind="mergesort")]
+    blocks = np.empty_like(runs)
+    k = -1
+    for i in range(len(runs)):
+        if k >= 0 and runs[i, 0] < blocks[k, 1] + m:
+            blocks[k, 1] = max(blocks[k, 1], runs[i, 1])
+        else:
+            k += 1
+            blocks[k, 0], blocks[k, 1] = runs[i, 0], runs[i, 1]
+    return blocks[:k+1].copy()
+
+
+def packed_results(alg, P, packed, results):
+    """
+    Scan a PackedDNA for pattern P (bytes, length 1..64) with the
+    2-bit Shift-And (alg='and') or BNDM (alg='bndm') kernel;
+    yield arrays of end positions in increasing order, as the byte kernels
+    would find them in unpack_2bit(packed). 'results' is the buffer of the
+    kernel calls and is overwritten by the next one.
+    """
+    m = len(P)
+    if not 0 < m <= 64:
+        raise ValueError(f"the pattern has length {m}, the 2-bit kernels need length 1..64")
+    nfa, find_matches = get_kernel(alg, P)  # byte kernel for the irregular blocks
+    mask, accept = nfa
+    mask4 = mask[np.frombuffer(b"ACGT", dtype=np.uint8)]
+    kernel = {"and": shift_and_2bit, "bndm": bndm_2bit}[alg]
+    state = np.zeros(2, dtype=np.uint64)
+    lo = 0
+    for (bs, be) in _irregular_blocks(packed.lower, packed.exceptions, m).tolist() + [(packed.n, packed.n)]:
+        state[:] = 0
+        while True:  # matches in the regular segment lo..bs-1
+            k = kernel(mask4, accept, packed.words, lo, bs, results, state)
+            if k == 0:
+                break
+            yield results[:k]
+        if bs < be:  # matches that overlap the block
+            a = max(0, bs - m + 1)
+            text = unpack_2bit(packed, a, min(packed.n, be + m - 1))
+            for k in iter_results(find_matches, nfa, text, results):
+                found = results[:k]
+                found += a
+                yield found
+        lo = be
+
+
+# automatic algorithm selection:
+# a calibration run measures the scan time per byte of each exact kernel
+# for a grid of pattern lengths and alphabet sizes on random texts,
+# and on a text where every position is a match ('dense').
+# The predicted time for a text with hit density d (hits per byte) is
+# (1 - d) * random + d * dense at the nearest grid point.
+
+AUTO_ALGORITHMS = ("and", "or", "bndm", "horspool", "bom", "ebom")
+CALIBRATION_VERSION = 2
+CALIBRATION_LENGTHS = (4, 8, 16, 32, 64, 128)
+CALIBRATION_ALPHABETS = (2, 4, 20)
+CALIBRATION_LETTERS = b"ACGTDEFHIKLMNPQRSVWY"
+
+
+def calibration_file():
+    """name of the calibration file: $BNDM_CACHE/calibration.json or ~/.cache/bndm/calibration.json"""
+    cachedir = os.environ.get("BNDM_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "bndm"))
+    return os.path.join(cachedir, "calibration.json")
+
+
+def _time_per_byte(nfa, find_matches, text, results, repeat=3):
+    """best time per byte of 'repeat' scans of text"""
+    for _ in iter_results(find_matches, nfa, text[:1000], results):  # compile
+        pass
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in iter_results(find_matches, nfa, text, results):
+            pass
+        best = min(best, time.perf_counter() - t0)
+    return best / len(text)
+
+
+def calibrate(textsize=1 << 20, seed=42):
+    """
+    Run the calibration benchmark and return its results as a dict
+    with per-algorithm times per byte: 'random'[alg][length][alphabet]
+    and 'dense'[alg][length].
+    """
+    rng = np.random.default_rng(seed)
+    results = np.zeros(1 << 16, dtype=np.uint64)
+    cal = dict(version=CALIBRATION_VERSION, lengths=CALIBRATION_LENGTHS,
+        alphabets=CALIBRATION_ALPHABETS, random={}, dense={})
+    texts = [rng.choice(np.frombuffer(CALIBRATION_LETTERS[:s], dtype=np.uint8), size=textsize)
+        for s in CALIBRATION_ALPHABETS]
+    dense = np.full(textsize, CALIBRATION_LETTERS[0], dtype=np.uint8)
+    for alg in AUTO_ALGORITHMS:
+        cal["random"][alg] = [[_time_per_byte(*get_kernel(alg, bytes(text[:m])), text, results)
+            for text in texts] for m in CALIBRATION_LENGTHS]
+        cal["dense"][alg] = [_time_per_byte(*get_kernel(alg, bytes(dense[:m])), dense, results)
+            for m in CALIBRATION_LENGTHS]
+    return cal
+
+
+def load_calibration(recalibrate=False):
+    """
+    Return the stored calibration of this machine;
+    run and store the calibration first if there is none (or if recalibrate is True).
+    """
+    filename = calibration_file()
+    if not recalibrate:
+        try:
+            with open(filename) as f:
+                cal = json.load(f)
+            if cal.get("version") == CALIBRATION_VERSION:
+                return cal
+        except (OSError, ValueError):
+            pass
+    print(f"# Calibrating algorithms (stored in '{filename}')...", file=sys.stderr)
+    cal = calibrate()
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename + ".tmp", "w") as f:
+        json.dump(cal, f)
+    os.replace(filename + ".tmp", filename)
+    return cal
+
+
+def _nearest(grid, x):
+    """index of the grid value nearest to x on a log scale"""
+    return int(np.argmin([abs(np.log(g) - np.log(max(x, 1))) for g in grid]))
+
+
+def choose_algorithm(P, sample, cal):
+    """
+    Choose the fastest exact algorithm for pattern P (bytes)
+    on texts like 'sample' (uint8 array), according to calibration cal.
+    Return (alg, info) where info describes the decision.
+    """
+    counts = np.bincount(sample, minlength=256).astype(np.float64)
+    freq = counts / counts.sum() if counts.sum() > 0 else np.full(256, 1 / 4)
+    sigma = 1 / max(np.sum(freq ** 2), 1e-12)  # effective alphabet size
+    density = float(np.prod([freq[a] for a in P]))  # expected hits per byte
+    i = _nearest(cal["lengths"], len(P))
+    j = _nearest(cal["alphabets"], sigma)
+    predicted = {alg: (1 - density) * cal["random"][alg][i][j] + density * cal["dense"][alg][i]
+        for alg in cal["random"]}
+    alg = min(predicted, key=predicted.get)
+    info = dict(length=len(P), alphabet=round(float(sigma), 1), density=density,
+        mbps={a: round(1e-6 / t, 1) for (a, t) in predicted.items()})
+    return alg, info
+
+
+def _results(find_matches, nfa, text, overlap, buffers, threads=1, intervals=None):
+    """
+    internal generator that yields the nonempty results of a scan of text
+    (or of its intervals) as lists of arrays (one per buffer),
+    using 'threads' threads (0: all cores)
+    """
+    if threads == 1:
+        for (a, b) in ([(0, len(text))] if intervals is None else np.asarray(intervals).tolist()):
+            for k in iter_results(find_matches, nfa, text[a:b], *buffers):
+                found = [buf[:k] for buf in buffers]
+                ends = found[0] if found[0].ndim == 1 else found[0][:, 0]
+                ends += a  # global coordinates
+                yield found
+        return
+    for found in parallel_results(find_matches, nfa, text, overlap, *buffers,
+            threads=threads or None, intervals=intervals):
+        if len(found[0]) > 0:
+            yield found
+
+
+def _matches(find_matches, nfa, text, buffers, intervals=None, first=1):
+    """
+    internal generator that lazily yields the matches of a scan of text
+    (or of its intervals) one by one, like iter_matches
+    """
+    for (a, b) in ([(0, len(text))] if intervals is None else np.asarray(intervals).tolist()):
+        for match in iter_matches(find_matches, nfa, text[a:b], *buffers, first=first):
+            if isinstance(match, tuple):
+                yield (match[0] + a, *match[1:])  # global coordinates
+            else:
+                yield match + a
+
+
+def _limit(args):
+    """internal function that returns the maximal number of matches per record to report, or None"""
+    return 1 if args.exists else args.limit
+
+
+def _records(args):
+    """
+    internal generator that yields (header, sequence, intervals) of the FASTA file;
+    intervals is None unless N-runs or soft-masked regions are skipped.
+    With --pipeline, records are parsed into depth + 2 reusable buffers,
+    enough for the records in the pipeline queue, the scanned and the parsed one.
+    """
+    buffers = None
+    if args.pipeline:
+        buffers = [np.zeros(0, dtype=np.uint8) for _ in range(args.pipeline + 2)]
+    if args.skip_n > 0 or args.skip_masked:
+        yield from fasta_intervals(args.fasta, args.skip_n, args.skip_masked, buffers)
+    else:
+        for (header, seq) in fasta_items(args.fasta, buffers):
+            yield (header, seq, None)
+
+
+def _scan_record(find_matches, nfa, overlap, buffers, args, record, first=1):
+    """
+    internal generator that scans one record (header, sequence, intervals)
+    and yields its output: lines (str) and lists of columns of results
+    (end positions, distances or pattern indices) copied out of the buffers
+    """
+    header, sequence, intervals = record
+    yield "# " + header.decode("ASCII")
+    limit = _limit(args)
+    if limit is not None:
+        found = itertools.islice(_matches(find_matches, nfa, sequence, buffers, intervals, first), limit)
+        if args.exists:
+            yield str(int(next(found, None) is not None))
+            return
+        found = list(found)
+        yield list(zip(*found)) if found and isinstance(found[0], tuple) else [found]
+        return
+    for found in _results(find_matches, nfa, sequence, overlap, buffers, args.threads, intervals):
+        yield [c.copy() for f in found for c in (f.T if f.ndim > 1 else [f])]
+
+
+def _write_output(out):
+    """internal function that prints an output item of _scan_record, one result per line"""
+    if isinstance(out, str):
+        print(out)
+        return
+    columns = [c.tolist() if isinstance(c, np.ndarray) else c for c in out]
+    if len(columns) == 0 or len(columns[0]) == 0:
+        return
+    if len(columns) == 1:
+        print(*columns[0], sep="\n")
+    else:
+        for row in zip(*columns):
+            print(*row, sep="\t")
+
+
+def _run(args, records, scan):
+    """
+    internal function that scans and prints the records,
+    with --pipeline in three threads (see pipeline), whose timing goes to stderr
+    """
+    if not args.pipeline:
+        for record in records:
+            for out in scan(record):
+                _write_output(out)
+        return
+    timing = pipeline(records, scan, _write_output, args.pipeline)
+    print("# pipeline: " + ", ".join(f"{stage} {t:.3f} s" for (stage, t) in timing.items()),
+        file=sys.stderr)
+
+
+def main_packed(args):
+    """search all patterns of a pattern file in one pass with packed Shift-And"""
+    with open(args.patternfile, "rb") as fpat:
+        Ps = [line.strip() for line in fpat if line.strip()]
+    nfa = build_nfa_packed(Ps)
+    NRESULTS = max(args.maxresults, len(Ps))  # all matches at one position must fit
+    results = np.zeros((NRESULTS, 2), dtype=np.uint64)
+    overlap = max(len(P) for P in Ps) - 1
+    scan = functools.partial(_scan_record, shift_and_packed, nfa, overlap, (results,), args,
+        first=len(Ps))
+    _run(args, _records(args), scan)
+
+
+def main(args):
+    if args.genome_cache and load_genome_cache(args.fasta) is None:
+        make_genome_cache(args.fasta)
+    if args.patternfile is not None:
+        return main_packed(args)
+    alg = args.algorithm
+    P = args.pattern.encode("ASCII")
+    records = _records(args)
+    if alg == "auto":
+        first = next(records, None)
+        sample = first[1][:1 << 20] if first is not None else np.zeros(0, dtype=np.uint8)
+        alg, info = choose_algorithm(P, sample, load_calibration(args.recalibrate))
+        print(f"# auto: chose '{alg}' for {info}", file=sys.stderr)
+        records = itertools.chain([first] if first is not None else [], records)
+
     NRESULTS = args.maxresults
     results = np.zeros(NRESULTS, dtype=np.uint64)
+    distances = np.zeros(NRESULTS, dtype=np.uint64)
+    limit = _limit(args)
+
+    if args.packed:
+        if args.pipeline:
+            raise ValueError("--pipeline does not work with --packed")
+        if alg not in ("and", "bndm"):
+            raise ValueError(f"--packed works with '-a and' and '-a bndm', not with '{alg}'")
+        if limit is not None:
+            results = results[:limit]  # kernel calls stop after 'limit' matches
+        for header, packed in fasta_packed(args.fasta):
+            print("#", header.decode("ASCII"))
+            found = (p for f in packed_results(alg, P, packed, results) for p in f.tolist())
+            if args.exists:
+                print(int(next(found, None) is not None))
+            else:
+                _write_output([list(itertools.islice(found, limit))])
+        return
+
+    nfa, find_matches = get_kernel(alg, P)
+    overlap = len(P) - 1  # windows of parallel scans overlap by a match length
+    if alg == "myers":
+        nfa = (*nfa, args.errors)
+        overlap += args.errors  # an approximate match spans up to m + k characters
+
+    buffers = (results, distances) if alg == "myers" else (results,)
+    _run(args, records, functools.partial(_scan_record, find_matches, nfa, overlap, buffers, args))
+
+
+class _PrecompileAction(argparse.Action):
+    """argparse action that runs precompile() and exits, without further arguments (like --version)"""
 
-    nfa = build_nfa(P)
+    def __init__(self, option_strings, dest, help=None):
+        super().__init__(option_strings, dest, nargs=0, help=help)
 
-    for header, sequence in fasta_items(args.fasta):
-        print("#", header.decode("ASCII"))
-        nresults = find_matches(*nfa, sequence, results)
-        if nresults > NRESULTS:
-            print("! Too many results, showing first {NRESULTS}")
-            nresults = NRESULTS
-        print(*list(results[:nresults]), sep="\n")
+    def __call__(self, parser, namespace, values, option_string=None):
+        precompile()
+        parser.exit()
 
 
 def get_argument_parser():
     p = argparse.ArgumentParser(description="Pattern search, shift_and, shift_or, bndm")
+    p.add_argument("--precompile", action=_PrecompileAction,
+        help="compile all kernels into numba's on-disk cache and exit "
+            "(once after installation, so that the first run starts fast)")
     p.add_argument("--fasta", "-f", required=True,
         help="FASTA file of genome")
-    p.add_argument("-P", "--pattern",
+    pat = p.add_mutually_exclusive_group(required=True)
+    pat.add_argument("-P", "--pattern",
         help="immediate pattern to be matched")
+    pat.add_argument("-p", "--patternfile",
+        help="file of patterns (one per line, at most 64 long each) to be matched "
+            "in one pass with packed Shift-And; prints (end position, pattern index)")
     p.add_argument("-a", "--algorithm", metavar="ALGORITHM",
-        default="and", choices=("and", "or", "bndm"),
-        help="algorithm to use ('and' (default), 'or', 'bndm')")
+        default="and", choices=("and", "or", "bndm", "horspool", "bom", "ebom", "myers", "auto"),
+        help="algorithm to use ('and' (default), 'or', 'bndm', 'horspool', "
+            "'bom' (backward oracle matching), 'ebom' (extended BOM); "
+            "'myers' for approximate matching with up to -k errors; "
+            "'auto' to choose the fastest exact one from a calibration of this machine)")
+    p.add_argument("--recalibrate", action="store_true",
+        help="with '-a auto', rerun the calibration benchmark "
+            "(stored in $BNDM_CACHE or ~/.cache/bndm)")
+    p.add_argument("-k", "--errors", type=int, default=0,
+        help="maximum edit distance for '-a myers'; prints (end position, distance) [0]")
     p.add_argument("--maxresults", "-R", type=int, default=10_000,
-        help="maximum number of results to output [10_000]")
+        help="number of results collected per kernel call before they are written; "
+            "all results are reported [10_000]")
+    lim = p.add_mutually_exclusive_group()
+    lim.add_argument("--limit", "-n", type=int,
+        help="report only the first LIMIT matches of each record; "
+            "the scan stops after them (single thread)")
+    lim.add_argument("--exists", action="store_true",
+        help="only report whether each record contains a match (1) or not (0); "
+            "the scan stops at the first match")
+    p.add_argument("--threads", "-t", type=int, default=1,
+        help="number of threads that scan windows of each record in parallel (0: all cores) [1]")
+    p.add_argument("--skip-n", type=int, default=0, metavar="MINRUN",
+        help="do not scan runs of at least MINRUN N's (assembly gaps); "
+            "no match spans a skipped run (0: scan everything) [0]")
+    p.add_argument("--skip-masked", action="store_true",
+        help="do not scan soft-masked (lowercase) regions; no match overlaps them")
+    p.add_argument("--packed", action="store_true",
+        help="hold each record as 2-bit packed DNA (a quarter of the memory) and scan it "
+            "with the 2-bit '-a and' or '-a bndm' kernels (patterns up to 64; single thread)")
+    p.add_argument("--pipeline", type=int, nargs="?", const=2, default=0, metavar="DEPTH",
+        help="parse, scan and write in three threads connected by queues of DEPTH [2] records "
+            "or results, parsing into reusable buffers; prints the time of each stage to stderr "
+            "(not with --packed)")
+    p.add_argument("--genome-cache", action="store_true",
+        help="convert the FASTA file into a binary cache (FASTA.seq, FASTA.idx.npz) "
+            "if it has none; an up-to-date cache is always used")
     return p
 
 
@@ -0,0 +1,165 @@
+"""
+Benchmarks for bndm.py
+
+Run, for example:
+python bndm_bench.py threads --textsize 250000000 --threads 1 2 4 8
+python bndm_bench.py startup --repeat 5
+python bndm_bench.py skip --lengths 8 16 32 64 --alphabet ACGT
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bndm import build_nfa_and, build_nfa_or, shift_and, shift_or, bndm, parallel_results
+from bndm import get_kernel, iter_results
+
+
+def random_text(rng, n, alphabet=b"ACGT"):
+    """random uint8 text of length n over the given alphabet"""
+    return rng.choice(np.frombuffer(alphabet, dtype=np.uint8), size=n)
+
+
+def bench_threads(args):
+    """
+    Scaling of the thread-parallel window scan with the number of threads
+    for each kernel on one long random record (like a chromosome).
+    """
+    rng = np.random.default_rng(args.seed)
+    text = random_text(rng, args.textsize)
+    P = bytes(random_text(rng, args.length))
+    kernels = dict(
+        shift_and=(shift_and, build_nfa_and(P)),
+        shift_or=(shift_or, build_nfa_or(P)),
+        bndm=(bndm, build_nfa_and(P[::-1])),
+    )
+    threads = args.threads or list(range(1, (os.cpu_count() or 1) + 1))
+    buffer = np.zeros(args.maxresults, dtype=np.uint64)
+    print(f"# text length {args.textsize}, pattern length {args.length}, {os.cpu_count()} cores")
+    print("# kernel\tthreads\ttime [s]\thits\tMbp/s\tspeedup")
+    for (name, (find_matches, (mask, accept))) in kernels.items():
+        nfa = (mask, np.uint64(accept))
+        list(parallel_results(find_matches, nfa, text[:10_000], len(P) - 1, buffer, threads=1))  # compile
+        t1 = None
+        for t in threads:
+            t0 = time.perf_counter()
+            nhits = sum(len(f) for (f,) in parallel_results(find_matches, nfa, text, len(P) - 1,
+                buffer, threads=t, chunksize=args.chunksize))
+            tscan = time.perf_counter() - t0
+            t1 = t1 or tscan
+            print(f"{name}\t{t}\t{tscan:.3f}\t{nhits}\t{args.textsize / tscan / 1e6:.0f}\t{t1 / tscan:.2f}")
+
+
+def bench_skip(args):
+    """
+    Throughput of the skip-based kernels (Horspool, BOM, EBOM)
+    against bndm and Shift-And for several pattern lengths
+    on a random text (best of --repeat scans).
+    """
+    rng = np.random.default_rng(args.seed)
+    text = random_text(rng, args.textsize, args.alphabet.encode())
+    buffer = np.zeros(args.maxresults, dtype=np.uint64)
+    print(f"# text length {args.textsize}, alphabet {args.alphabet}")
+    print("# length\t" + "\t".join(f"{alg} [Mbp/s]" for alg in args.algorithms))
+    for m in args.lengths:
+        P = bytes(text[1000:1000+m])
+        rates = []
+        for alg in args.algorithms:
+            nfa, find_matches = get_kernel(alg, P)
+            for _ in iter_results(find_matches, nfa, text[:10_000], buffer):  # compile
+                pass
+            best = float("inf")
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                for _ in iter_results(find_matches, nfa, text, buffer):
+                    pass
+                best = min(best, time.perf_counter() - t0)
+            rates.append(args.textsize / best / 1e6)
+        print(f"{m}\t" + "\t".join(f"{r:.0f}" for r in rates))
+
+
+def bench_startup(args):
+    """
+    Wall-clock latency of short CLI runs of bndm.py and MUM.py (a few kb of text):
+    module import only, the first run with an empty numba cache (cold),
+    later runs (warm, best of --repeat), the explicit compilation with --precompile
+    into another empty cache, and the first run after it.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    mumdir = os.path.join(here, "..", "Maximal Unique Matches")
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        fasta = []
+        for name in ("a.fa", "b.fa"):
+            fasta.append(os.path.join(tmp, name))
+            with open(fasta[-1], "wb") as f:
+                f.write(b">" + name.encode() + b"\n" + bytes(random_text(rng, args.textsize)) + b"\n")
+        runs = [
+            ("bndm.py", here, ["-c", "import bndm"], [os.path.join(here, "bndm.py"), "-f", fasta[0], "-P", "ACGTACGT"]),
+            ("MUM.py", mumdir, ["-c", "import MUM"], [os.path.join(mumdir, "MUM.py"), fasta[0], fasta[1]]),
+        ]
+
+        def run(cwd, argv, cache="numba"):
+            env = dict(os.environ, NUMBA_CACHE_DIR=os.path.join(tmp, cache))
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, *argv], cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+            return time.perf_counter() - t0
+
+        print(f"# text length {args.textsize}")
+        print("# script\timport [s]\tcold [s]\twarm [s]\tprecompile [s]\tfirst after precompile [s]")
+        for (name, cwd, imp, argv) in runs:
+            timport = min(run(cwd, imp) for _ in range(args.repeat))
+            cold = run(cwd, argv)
+            warm = min(run(cwd, argv) for _ in range(args.repeat))
+            tpre = run(cwd, [argv[0], "--precompile"], cache="precompiled-" + name)
+            first = run(cwd, argv, cache="precompiled-" + name)
+            print(f"{name}\t{timport:.2f}\t{cold:.2f}\t{warm:.2f}\t{tpre:.2f}\t{first:.2f}")
+
+
+def get_argument_parser():
+    p = argparse.ArgumentParser(description="BNDM / Shift-And / Shift-Or benchmarks")
+    p.add_argument("--seed", type=int, default=42,
+        help="random seed [42]")
+    sub = p.add_subparsers(dest="benchmark", required=True)
+    b = sub.add_parser("threads", help="scaling of the thread-parallel scan")
+    b.add_argument("--textsize", type=int, default=250_000_000,
+        help="length of the random text [250_000_000]")
+    b.add_argument("--length", type=int, default=8,
+        help="pattern length [8]")
+    b.add_argument("--threads", type=int, nargs="+",
+        help="numbers of threads (default: 1 to the number of cores)")
+    b.add_argument("--chunksize", type=int, default=1 << 22,
+        help="bytes per window [4194304]")
+    b.add_argument("--maxresults", "-R", type=int, default=10_000,
+        help="results per kernel call [10_000]")
+    b.set_defaults(func=bench_threads)
+    b = sub.add_parser("skip", help="skip-based kernels against bndm across pattern lengths")
+    b.add_argument("--textsize", type=int, default=50_000_000,
+        help="length of the random text [50_000_000]")
+    b.add_argument("--alphabet", default="ACGT",
+        help="letters of the random text [ACGT]")
+    b.add_argument("--lengths", type=int, nargs="+", default=[8, 16, 32, 64],
+        help="pattern lengths [8 16 32 64]")
+    b.add_argument("--algorithms", nargs="+", default=["and", "bndm", "horspool", "bom", "ebom"],
+        help="algorithms to compare [and bndm horspool bom ebom]")
+    b.add_argument("--repeat", type=int, default=3,
+        help="scans per measurement (best is reported) [3]")
+    b.add_argument("--maxresults", "-R", type=int, default=10_000,
+        help="results per kernel call [10_000]")
+    b.set_defaults(func=bench_skip)
+    b = sub.add_parser("startup", help="cold and warm start latency of the CLIs")
+    b.add_argument("--textsize", type=int, default=5_000,
+        help="length of the random genomes [5_000]")
+    b.add_argument("--repeat", type=int, default=3,
+        help="runs for the import and warm timings (best is reported) [3]")
+    b.set_defaults(func=bench_startup)
+    return p
+
+
+if __name__ == "__main__":
+    args = get_argument_parser().parse_args()
+    args.func(args)
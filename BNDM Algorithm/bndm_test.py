@@ -1,5 +1,20 @@
-
 from bndm import build_nfa_and, bndm
+from bndm import build_nfa_and_multi, build_nfa_or_multi, shift_and_multi, shift_or_multi, bndm_multi
+from bndm import build_nfa_packed, shift_and_packed
+from bndm import myers
+from bndm import build_nfa_or, shift_and, shift_or, iter_results
+from bndm import fasta_items, make_genome_cache, load_genome_cache
+from bndm import parallel_results, choose_algorithm
+from bndm import get_kernel, informative_intervals, _results
+from bndm import pack_2bit, unpack_2bit, packed_results
+from bndm import iter_matches, pipeline
+from bndm import _fasta_reads_into, _fasta_reads_from_filelike
+from bndm import precompile
+import gzip
+import io
+import itertools
+import pytest
+import os
 import numpy as np
 
 def test_bndm():
@@ -15,3 +30,272 @@ def test_bndm():
     assert results[2] == 0
     assert results[3] == 0
     assert results[4] == 0
+
+def test_multi_word():
+    rng = np.random.default_rng(1)
+    text = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=5000)
+    text[3000:3150] = text[100:250]
+    for m in (10, 64, 65, 150):
+        P = bytes(text[100:100+m])
+        expected = [p + m - 1 for p in range(len(text) - m + 1) if bytes(text[p:p+m]) == P]
+        for (build_nfa, find_matches) in ((build_nfa_and_multi, shift_and_multi),
+                (build_nfa_or_multi, shift_or_multi),
+                (lambda x: build_nfa_and_multi(x[::-1]), bndm_multi)):
+            mask, accept = build_nfa(P)
+            results = np.zeros(10, dtype=np.uint64)
+            nresults = find_matches(mask, np.uint64(accept), text, results)
+            assert list(results[:nresults]) == expected
+
+def test_shift_and_packed():
+    rng = np.random.default_rng(2)
+    text = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=5000)
+    Ps = [bytes(rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=rng.integers(3, 13)))
+        for _ in range(40)] + [b"ACG", b"ACG", b"A" * 64]
+    nfa = build_nfa_packed(Ps)
+    assert nfa[0].shape[1] <= -(-sum(len(P) for P in Ps) // 64) + 1  # first-fit decreasing
+    results = np.zeros((10_000, 2), dtype=np.uint64)
+    nresults = shift_and_packed(*nfa, text, results)
+    expected = sorted((p + len(P) - 1, i) for (i, P) in enumerate(Ps)
+        for p in range(len(text) - len(P) + 1) if bytes(text[p:p+len(P)]) == P)
+    assert sorted(map(tuple, results[:nresults].tolist())) == expected
+
+def test_myers():
+    rng = np.random.default_rng(3)
+    text = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=600)
+    for (m, k) in ((8, 2), (70, 10)):
+        P = bytes(text[50:50+m])
+        # semi-global edit distance: D[i] = min distance of P[:i] to a suffix of the text read
+        expected = []
+        D = list(range(m + 1))
+        for (p, c) in enumerate(text):
+            E = [0]
+            for i in range(1, m + 1):
+                E.append(min(D[i] + 1, E[i-1] + 1, D[i-1] + (P[i-1] != c)))
+            D = E
+            if D[m] <= k:
+                expected.append((p, D[m]))
+        peq, accept = build_nfa_and_multi(P)
+        results = np.zeros(1000, dtype=np.uint64)
+        distances = np.zeros(1000, dtype=np.uint64)
+        nresults = myers(peq, np.uint64(accept), k, text, results, distances)
+        assert list(zip(results[:nresults].tolist(), distances[:nresults].tolist())) == expected
+
+
+def test_iter_results():
+    # a tiny buffer forces many resumed kernel calls; results must equal one big call
+    rng = np.random.default_rng(4)
+    text = rng.choice(np.frombuffer(b"AC", dtype=np.uint8), size=3000)
+    for m in (3, 70):
+        P = bytes(text[100:100+m])
+        single = m <= 64
+        cases = [
+            (shift_and if single else shift_and_multi, (build_nfa_and if single else build_nfa_and_multi)(P)),
+            (shift_or if single else shift_or_multi, (build_nfa_or if single else build_nfa_or_multi)(P)),
+            (bndm if single else bndm_multi, (build_nfa_and if single else build_nfa_and_multi)(P[::-1])),
+        ]
+        for (find_matches, (mask, accept)) in cases:
+            nfa = (mask, np.uint64(accept))
+            big = np.zeros(len(text), dtype=np.uint64)
+            expected = big[:find_matches(*nfa, text, big)].tolist()
+            small = np.zeros(7, dtype=np.uint64)
+            found = [p for k in iter_results(find_matches, nfa, text, small) for p in small[:k].tolist()]
+            assert found == expected and len(found) > 0
+        peq, accept = build_nfa_and_multi(P)
+        nfa = (peq, np.uint64(accept), 1)
+        big, bigd = np.zeros(len(text), dtype=np.uint64), np.zeros(len(text), dtype=np.uint64)
+        n = myers(*nfa, text, big, bigd)
+        small, smalld = np.zeros(5, dtype=np.uint64), np.zeros(5, dtype=np.uint64)
+        found = [(p, d) for k in iter_results(myers, nfa, text, small, smalld)
+            for (p, d) in zip(small[:k].tolist(), smalld[:k].tolist())]
+        assert found == list(zip(big[:n].tolist(), bigd[:n].tolist()))
+    Ps = [b"ACA", b"CA", b"A", b"AAC"]
+    nfa = build_nfa_packed(Ps)
+    big = np.zeros((len(text) * len(Ps), 2), dtype=np.uint64)
+    expected = big[:shift_and_packed(*nfa, text, big)].tolist()
+    small = np.zeros((len(Ps), 2), dtype=np.uint64)
+    found = [r for k in iter_results(shift_and_packed, nfa, text, small) for r in small[:k].tolist()]
+    assert found == expected
+
+
+def test_genome_cache(tmp_path):
+    fasta = tmp_path / "g.fa"
+    fasta.write_bytes(b">one\nACGT\nAC\n;comment\n>two\n>three x\nGGG\n")
+    fasta = str(fasta)
+    expected = [(h, s.tolist()) for (h, s) in fasta_items(fasta)]
+    assert load_genome_cache(fasta) is None
+    make_genome_cache(fasta)
+    assert load_genome_cache(fasta) is not None
+    assert [(h, s.tolist()) for (h, s) in fasta_items(fasta)] == expected
+    os.utime(fasta, ns=(0, 0))  # a modified FASTA file invalidates the cache
+    assert load_genome_cache(fasta) is None
+
+
+def test_parallel_results():
+    # windows much shorter than the text, including hits across window boundaries
+    rng = np.random.default_rng(5)
+    text = rng.choice(np.frombuffer(b"AC", dtype=np.uint8), size=5000)
+    P = bytes(text[100:108])
+    for (find_matches, (mask, accept)) in ((shift_and, build_nfa_and(P)), (bndm, build_nfa_and(P[::-1]))):
+        nfa = (mask, np.uint64(accept))
+        big = np.zeros(len(text), dtype=np.uint64)
+        expected = big[:find_matches(*nfa, text, big)].tolist()
+        found = [p for (f,) in parallel_results(find_matches, nfa, text, len(P) - 1,
+            np.zeros(4, dtype=np.uint64), threads=3, chunksize=97) for p in f.tolist()]
+        assert found == expected
+    peq, accept = build_nfa_and_multi(P)
+    nfa = (peq, np.uint64(accept), 2)
+    big, bigd = np.zeros(len(text), dtype=np.uint64), np.zeros(len(text), dtype=np.uint64)
+    n = myers(*nfa, text, big, bigd)
+    found = [r for (f, d) in parallel_results(myers, nfa, text, len(P) + 1,
+        np.zeros(4, dtype=np.uint64), np.zeros(4, dtype=np.uint64), threads=3, chunksize=97)
+        for r in zip(f.tolist(), d.tolist())]
+    assert found == list(zip(big[:n].tolist(), bigd[:n].tolist()))
+    # windows are submitted lazily: taking the first result starts at most 2 * threads windows
+    started = []
+    def kernel(mask, accept, text, results, state):
+        if state[0] == 0:
+            started.append(len(text))
+        return shift_and(mask, accept, text, results, state)
+    mask, accept = build_nfa_and(P)
+    windows = parallel_results(kernel, (mask, np.uint64(accept)), text, len(P) - 1,
+        np.zeros(4, dtype=np.uint64), threads=2, chunksize=97)
+    next(windows)
+    assert len(started) <= 4
+    assert sum(1 for _ in windows) == -(-len(text) // 97) - 1
+
+
+def test_choose_algorithm():
+    # calibration in seconds per byte: bndm is fastest on long patterns unless (almost) every position matches
+    cal = dict(lengths=[4, 32], alphabets=[2, 4],
+        random=dict(bndm=[[4, 3], [2, 1]], **{"and": [[1, 1], [1.5, 1.5]], "or": [[2, 2], [2, 2]]}),
+        dense=dict(bndm=[8, 40], **{"and": [2, 2], "or": [3, 3]}))
+    dna = np.frombuffer(b"ACGT" * 100, dtype=np.uint8)
+    assert choose_algorithm(b"ACG", dna, cal)[0] == "and"
+    assert choose_algorithm(b"ACGTACGTACGTACGTACGTACGTACGTACG", dna, cal)[0] == "bndm"
+    poly_a = np.frombuffer(b"A" * 400, dtype=np.uint8)
+    alg, info = choose_algorithm(b"A" * 30, poly_a, cal)
+    assert alg == "and" and info["density"] == 1.0
+
+
+def test_skip_algorithms():
+    rng = np.random.default_rng(6)
+    for alphabet in (b"AC", b"ACGT", b"ACDEFGHIKLMNPQRSTVWY"):
+        text = rng.choice(np.frombuffer(alphabet, dtype=np.uint8), size=4000)
+        for m in (1, 2, 3, 8, 33, 100):
+            for P in (bytes(text[500:500+m]), bytes(text[:m]), bytes(text[-m:])):
+                expected = [p + m - 1 for p in range(len(text) - m + 1) if bytes(text[p:p+m]) == P]
+                for alg in ("horspool", "bom", "ebom"):
+                    nfa, find_matches = get_kernel(alg, P)
+                    results = np.zeros(len(text), dtype=np.uint64)
+                    assert results[:find_matches(*nfa, text, results)].tolist() == expected, (alg, m)
+                    small = np.zeros(3, dtype=np.uint64)
+                    found = [p for k in iter_results(find_matches, nfa, text, small) for p in small[:k].tolist()]
+                    assert found == expected, (alg, m)
+
+
+def test_informative_intervals():
+    seq = np.frombuffer(b"NNACGTNACGTacgtACGTNNNNACGTnnnNNNAC", dtype=np.uint8)
+    assert informative_intervals(seq).tolist() == [[0, 35]]
+    assert informative_intervals(seq, 2).tolist() == [[2, 19], [23, 27], [33, 35]]
+    assert informative_intervals(seq, 2, True).tolist() == [[2, 11], [15, 19], [23, 27], [33, 35]]
+    assert informative_intervals(seq, 0, True).tolist() == [[0, 11], [15, 27], [30, 35]]
+    # with masked, lowercase n is masked and does not lengthen a short N-run
+    mixed = lambda s: np.frombuffer(s, dtype=np.uint8)
+    assert informative_intervals(mixed(b"ANnNA"), 4, True).tolist() == [[0, 1], [4, 5]]
+    assert informative_intervals(mixed(b"ANnA"), 4, True).tolist() == [[0, 1], [3, 4]]
+    assert informative_intervals(mixed(b"AcnNA"), 4, True).tolist() == [[0, 1], [4, 5]]
+    assert informative_intervals(mixed(b"ANNA"), 4, True).tolist() == [[0, 4]]
+    assert informative_intervals(mixed(b"ANnA"), 3, False).tolist() == [[0, 4]]
+    assert informative_intervals(mixed(b"ANnnA"), 3, False).tolist() == [[0, 1], [4, 5]]
+    # scans of the intervals report global positions and no match across a gap
+    P = b"ACGT"
+    nfa, find_matches = get_kernel("bndm", P)
+    expected = [5, 10, 18, 26]
+    intervals = informative_intervals(seq, 2, True)
+    for threads in (1, 2):
+        results = np.zeros(2, dtype=np.uint64)
+        found = [p for (f,) in _results(find_matches, nfa, seq, len(P) - 1, (results,), threads, intervals)
+            for p in f.tolist()]
+        assert found == expected
+    nfa, find_matches = get_kernel("and", b"TNNNNA")
+    results = np.zeros(2, dtype=np.uint64)
+    assert [f.tolist() for (f,) in _results(find_matches, nfa, seq, 5, (results,))] == [[23]]
+    assert list(_results(find_matches, nfa, seq, 5, (results,), 1, informative_intervals(seq, 4))) == []
+
+
+def test_packed_2bit():
+    rng = np.random.default_rng(9)
+    text = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=5000)
+    for (a, b, c) in ((100, 140, b"N"), (700, 705, b"n"), (1000, 1400, b"a"), (1390, 1450, b"R"), (4990, 5000, b"g")):
+        text[a:b] = c[0]
+    text[2000:2040] = text[10:50]  # a match next to an irregular block
+    packed = pack_2bit(text)
+    assert packed.words.nbytes * 4 == len(text) + (-len(text) % 32)
+    assert unpack_2bit(packed).tobytes() == text.tobytes()
+    assert unpack_2bit(packed, 95, 145).tobytes() == text[95:145].tobytes()
+    for P in (bytes(text[10:50]), bytes(text[3000:3008]), b"ANNN", bytes(text[1395:1405]), b"A"):
+        for alg in ("and", "bndm"):
+            nfa, find_matches = get_kernel(alg, P)
+            results = np.zeros(len(text), dtype=np.uint64)
+            expected = results[:find_matches(*nfa, text, results)].tolist()
+            small = np.zeros(2, dtype=np.uint64)
+            assert [p for f in packed_results(alg, P, packed, small) for p in f.tolist()] == expected
+
+def test_iter_matches():
+    # taking the first few matches only scans a prefix of the text
+    rng = np.random.default_rng(7)
+    text = rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=200_000)
+    P = b"ACGTAC"
+    for alg in ("and", "bndm", "horspool", "ebom"):
+        nfa, find_matches = get_kernel(alg, P)
+        buffer = np.zeros(1000, dtype=np.uint64)
+        expected = buffer[:find_matches(*nfa, text, buffer)].tolist()
+        assert 3 < len(expected) < 1000
+        scanned = []
+        def kernel(*args):
+            k = find_matches(*args)
+            scanned.append(int(args[-1][0]))  # resume position
+            return k
+        assert list(itertools.islice(iter_matches(kernel, nfa, text, buffer), 3)) == expected[:3]
+        assert max(scanned) < len(text) // 4
+        assert list(iter_matches(find_matches, nfa, text, np.zeros(10, dtype=np.uint64))) == expected
+
+def test_fasta_reads_into():
+    texts = [b"> chr1 x\nAC GT\n  >hdr2\nACGT\n",  # indented header, spaces within a line
+        b">a\r\n AC\t\r\n\n;c\n  ;d\nG>T;\n\t>b\n\nA C \n  G\n>e\n>",
+        b">long\n" + b"ACGTN" * 1000 + b"   \n" + b"  T" * 100]
+    for text in texts:
+        expected = [(h, bytes(seq)) for (h, seq) in _fasta_reads_from_filelike(io.BytesIO(text))]
+        for blocksize in (1, 2, 7, 1 << 22):  # lines and headers across blocks
+            buffers = [np.zeros(1, dtype=np.uint8) for _ in range(2)]
+            records = [(h, bytes(seq)) for (h, seq) in _fasta_reads_into(io.BytesIO(text), buffers, blocksize)]
+            assert records == expected
+    assert expected[0] == (b"long", b"ACGTN" * 1000 + b"T" + b"  T" * 99)
+
+
+def test_pipeline(tmp_path):
+    # reusable parse buffers (used in turn, grown as needed), gzip input, results in order
+    fasta = tmp_path / "g.fa.gz"
+    records = [(b"r%d" % i, b"ACGT" * (10 ** (i % 4))) for i in range(12)]
+    fasta.write_bytes(gzip.compress(b"".join(b">%s\n%s\n" % r for r in records)))
+    buffers = [np.zeros(0, dtype=np.uint8) for _ in range(3)]
+    out = []
+    scan = lambda record: ((record[0], len(record[1]), bytes(record[1][-4:])),)
+    timing = pipeline(fasta_items(str(fasta), buffers), scan, out.append, depth=1)
+    assert out == [(h, len(s), b"ACGT") for (h, s) in records]
+    assert set(timing) == {"read", "scan", "write", "scan waiting", "wall"}
+    def failing():
+        yield (b"x", b"")
+        raise ValueError("bad record")
+    with pytest.raises(ValueError):
+        pipeline(failing(), scan, out.append)
+
+
+def test_precompile():
+    precompile()
+    text = np.frombuffer(b"ACGGGCTAGCTACGACGTACGATCAGCT", dtype=np.uint8)  # read-only
+    nfa, find_matches = get_kernel("and", b"AGCT")  # the numba dispatcher, as in main
+    compiled = len(find_matches.signatures)
+    results = np.zeros(5, dtype=np.uint64)
+    assert list(iter_results(find_matches, nfa, text, results)) == [2]
+    assert len(find_matches.signatures) == compiled  # nothing compiled lazily
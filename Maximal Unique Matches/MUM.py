@@ -1,8 +1,56 @@
 # mum.py
+import os
+import functools
+import threading
 from collections import defaultdict
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Action
 import numpy as np
-from numba import njit, int32, uint8
+
+
+# lazy just-in-time compilation (as in bndm.py):
+# 'njit' below imports numba only when a kernel is first called,
+# and compiles with cache=True, so later runs load the kernels
+# from numba's on-disk cache (see precompile).
+
+_KERNELS = []  # all lazily compiled kernels of this module
+_KERNELS_LOCK = threading.Lock()
+
+
+class _LazyKernel:
+    """placeholder for a numba kernel that is compiled on its first call"""
+
+    def __init__(self, func, options):
+        self.func, self.options = func, options
+        self.dispatcher = None
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        if self.dispatcher is None:
+            _load_kernels()
+        return self.dispatcher(*args, **kwargs)
+
+
+def njit(func=None, **options):
+    """lazy numba.njit with an on-disk cache"""
+    if func is None:
+        return lambda f: njit(f, **options)
+    kernel = _LazyKernel(func, options)
+    _KERNELS.append(kernel)
+    return kernel
+
+
+def _load_kernels():
+    """import numba and replace all lazy kernels of this module by numba dispatchers"""
+    with _KERNELS_LOCK:
+        if _KERNELS[0].dispatcher is not None:
+            return
+        import numba
+        g = globals()
+        for kernel in _KERNELS:
+            # callers of this kernel are compiled later and find the dispatcher in the globals
+            g[kernel.__name__] = numba.njit(cache=True, **kernel.options)(kernel.func)
+        for kernel in _KERNELS:
+            kernel.dispatcher = g[kernel.__name__]
 
 
 def _fasta_reads_from_filelike(f, COMMENT=b';'[0], HEADER=b'>'[0]):
@@ -26,12 +74,85 @@ def _fasta_reads_from_filelike(f, COMMENT=b';'[0], HEADER=b'>'[0]):
         yield (header, seq)
 
 
+# binary genome cache:
+# FILE.seq holds the sequences of all records of FILE back to back,
+# FILE.idx.npz holds the record offsets into FILE.seq, the headers,
+# and the size and modification time of FILE when the cache was made.
+
+def genome_cache_names(filename):
+    """names of the sequence and index files of the binary cache of a FASTA file"""
+    return filename + ".seq", filename + ".idx.npz"
+
+
+def _fasta_stamp(filename):
+    st = os.stat(filename)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def make_genome_cache(filename):
+    """
+    Convert a FASTA file into its binary cache, one record at a time.
+    Return the names of the sequence and index files.
+    """
+    seqname, idxname = genome_cache_names(filename)
+    headers, offsets = [], [0]
+    with open(filename, "rb") as f, open(seqname + ".tmp", "wb") as fseq:
+        for (header, seq) in _fasta_reads_from_filelike(f):
+            fseq.write(seq)
+            headers.append(header)
+            offsets.append(offsets[-1] + len(seq))
+    with open(idxname + ".tmp", "wb") as fidx:  # np.savez would append .npz to a name
+        np.savez(fidx, offsets=np.array(offsets, dtype=np.int64),
+            headers=np.frombuffer(b"\n".join(headers), dtype=np.uint8),
+            stamp=_fasta_stamp(filename))
+    os.replace(seqname + ".tmp", seqname)
+    os.replace(idxname + ".tmp", idxname)
+    return seqname, idxname
+
+
+def load_genome_cache(filename):
+    """
+    Return (headers, offsets, seq) from the binary cache of a FASTA file,
+    or None if there is no up-to-date cache.
+    seq is a read-only memory map of all sequences (shared by all processes
+    through the page cache); record i is seq[offsets[i]:offsets[i+1]].
+    """
+    seqname, idxname = genome_cache_names(filename)
+    try:
+        with np.load(idxname) as idx:
+            offsets, headers, stamp = idx["offsets"], idx["headers"], idx["stamp"]
+        if not np.array_equal(stamp, _fasta_stamp(filename)):
+            return None
+        if os.path.getsize(seqname) != offsets[-1]:
+            return None
+    except (OSError, KeyError, ValueError):
+        return None
+    headers = headers.tobytes().split(b"\n") if len(offsets) > 1 else []
+    if offsets[-1] == 0:  # an empty file cannot be mapped
+        seq = np.zeros(0, dtype=np.uint8)
+    else:
+        seq = np.asarray(np.memmap(seqname, dtype=np.uint8, mode="r"))
+    return headers, offsets, seq
+
+
 def make_genome_text(filename, sep=ord("&"), end=ord("$")):
     """
     Create a concatenated text from a genomic FASTA file,
     using the given sequence separator byte (sep) and sentinel byte (end).
     Return a bytearray with the concatenated bytes.
+    Uses the binary cache of the file if it has an up-to-date one.
     """
+    cache = load_genome_cache(filename)
+    if cache is not None:
+        headers, offsets, seq = cache
+        text = bytearray(len(seq) + len(headers) + 1)
+        t = np.frombuffer(text, dtype=np.uint8)
+        for i in range(len(headers)):
+            a, b = offsets[i], offsets[i+1]
+            t[a+i:b+i] = seq[a:b]
+            t[b+i] = sep  # the separator byte
+        t[-1] = end  # the end byte (sentinel)
+        return text
     text = bytearray()
     with open(filename, "rb") as f:
         for (header, seq) in _fasta_reads_from_filelike(f):
@@ -41,6 +162,55 @@ def make_genome_text(filename, sep=ord("&"), end=ord("$")):
     return text
 
 
+def write_genome_text(filename, f, sep=ord("&"), end=ord("$")):
+    """
+    Write the concatenated text of a genomic FASTA file (see make_genome_text)
+    to the binary file f, one record at a time. Return its length.
+    """
+    cache = load_genome_cache(filename)
+    n = 0
+    with open(filename, "rb") as fasta:
+        if cache is not None:
+            headers, offsets, data = cache
+            records = (data[offsets[i]:offsets[i+1]] for i in range(len(headers)))
+        else:
+            records = (seq for (header, seq) in _fasta_reads_from_filelike(fasta))
+        for seq in records:
+            f.write(seq)
+            f.write(bytes([sep]))  # the separator byte
+            n += len(seq) + 1
+    f.write(bytes([end]))  # the end byte (sentinel)
+    return n + 1
+
+
+# index arrays:
+# pos holds positions 0..n-1 in the smallest sufficient dtype (int32, uint32, int64),
+# keeping its largest value free as the empty marker of SA-IS;
+# lcp needs a signed dtype for its -1 borders (int32, int64).
+# With a scratch directory, the arrays are memory maps of files there
+# (pos.bin, lcp.bin), so that they need not fit into RAM next to each other;
+# SA-IS then also keeps its temporary arrays there (while it runs).
+
+def index_dtype(n):
+    """dtype of the positions in a suffix array of a text of length n"""
+    return np.int32 if n < 2**31 else (np.uint32 if n < 2**32 else np.int64)
+
+
+def lcp_dtype(n):
+    """dtype of the lcp array of a text of length n"""
+    return np.int32 if n < 2**31 else np.int64
+
+
+def allocate(n, dtype, scratch=None, name="array"):
+    """
+    Return an uninitialized array of n elements of the given dtype,
+    in RAM, or if scratch is a directory, as a memory map of scratch/name.bin.
+    """
+    if scratch is None or n == 0:
+        return np.empty(n, dtype=dtype)
+    return np.memmap(os.path.join(scratch, name + ".bin"), dtype=dtype, mode="w+", shape=(n,))
+
+
 def compute_pos_builtin(T):
     """
     using built-in sort with custom key function;
@@ -50,8 +220,8 @@ def compute_pos_builtin(T):
     """
     if len(T) > 10_000:
         raise RuntimeError("ERROR: Using built-in sort on texts over 10_000 characters will kill your memory!")
-    suffixes = lambda p: t[p:]
-    pos = sorted(range(len(t)), key=suffixes)
+    suffixes = lambda p: T[p:]
+    pos = sorted(range(len(T)), key=suffixes)
     # return numpy array -- for short texts, 32 bits is enough
     return np.array(pos, dtype=np.int32)
 
@@ -73,43 +243,260 @@ def compute_pos_manber_myers(T):
                 result.append(v[0])
         return result
     result = sort_bucket(T, range(len(T)), [], order=1)  # Python list
-    pos = np.array(result, dtype=np.int32)  # convert to numpy array
+    pos = np.array(result, dtype=index_dtype(len(T)))  # convert to numpy array
     return pos
 
 
-@njit
-def compute_lcp(T, pos):
+# SA-IS (Nong, Zhang and Chan, 2009): linear-time suffix sorting by induced sorting.
+# Each level classifies the suffixes as S or L type, sorts the LMS substrings
+# by induced sorting, names them, and sorts the LMS suffixes by recursing
+# on the string of names (in Python) unless all names are distinct;
+# a final induced sort then places all suffixes.
+# Empty entries of sa hold the largest value of its dtype (which may be unsigned).
+# The kernels allocate nothing: all temporary arrays are passed in,
+# so that _sais can place them in RAM or in scratch files.
+
+@njit(nogil=True)
+def _sais_buckets(s, ls, sum_l, sum_s):
     """
-    lcp using Kasai's linear-time algorithm on numpy arrays
+    internal kernel that sets ls[i] = 1 for S-type suffixes of s (0 for L-type),
+    stores the bucket starts of the L-type and of the S-type suffixes
+    of each character 0..len(sum_l)-2 in sum_l and sum_s,
+    and returns the number of LMS suffixes
     """
-    n = len(pos)
-    lcp = np.zeros(n+1, dtype=np.int32)
-    lcp[0] = lcp[n] = -1  # border sentinels
-    # compute rank, the inverse of pos
-    rank = np.zeros(n, dtype=np.int32)
-    for r in range(n):
-        rank[pos[r]] = r
+    n = len(s)
+    ls[n-1] = 0
+    m = 0
+    for i in range(n-2, -1, -1):
+        ls[i] = ls[i+1] if s[i] == s[i+1] else (s[i] < s[i+1])
+        if not ls[i] and ls[i+1]:
+            m += 1
+    sum_l[:] = 0
+    sum_s[:] = 0
+    for i in range(n):
+        if ls[i]:
+            sum_l[s[i] + 1] += 1
+        else:
+            sum_s[s[i]] += 1
+    for c in range(len(sum_l) - 1):
+        sum_s[c] += sum_l[c]
+        sum_l[c+1] += sum_s[c]
+    return m
+
+
+@njit(nogil=True)
+def _sais_induce(s, ls, sum_l, sum_s, lms, sa, buf, empty):
+    """
+    internal kernel that induces the order of all suffixes into sa
+    from the sorted LMS suffixes lms (buf: bucket pointers, like sum_l)
+    """
+    n = len(s)
+    sa[:] = empty
+    buf[:] = sum_s
+    for d in lms:
+        sa[buf[s[d]]] = d
+        buf[s[d]] += 1
+    buf[:] = sum_l
+    sa[buf[s[n-1]]] = n - 1
+    buf[s[n-1]] += 1
+    for i in range(n):
+        v = sa[i]
+        if v != empty and v >= 1 and not ls[v-1]:
+            sa[buf[s[v-1]]] = v - 1
+            buf[s[v-1]] += 1
+    buf[:] = sum_l
+    for i in range(n-1, -1, -1):
+        v = sa[i]
+        if v != empty and v >= 1 and ls[v-1]:
+            buf[s[v-1] + 1] -= 1
+            sa[buf[s[v-1] + 1]] = v - 1
+
 
-    lp = 0 # current common prefix length
-    for p in range(n-1):
-        r = rank[p]
-        if r == 0:  # pos[r] must be a sentinel, so lcp[r]=0
-            lcp[r] = 0
+@njit(nogil=True)
+def _sais_reduce(s, ls, sum_l, sum_s, sa, buf, lms_map, lms, rec, empty):
+    """
+    internal kernel that sorts the LMS substrings of s into sa and names them,
+    using lms_map (n entries) for the index of each LMS position;
+    stores the LMS positions into lms and the reduced string of their names
+    (in text order) into rec, and returns the largest name
+    """
+    n, m = len(s), len(lms)
+    lms_map[:] = empty
+    j = 0
+    for i in range(1, n):
+        if not ls[i-1] and ls[i]:
+            lms_map[i] = j
+            lms[j] = i
+            j += 1
+    _sais_induce(s, ls, sum_l, sum_s, lms, sa, buf, empty)
+    name = 0
+    prev = -1
+    for i in range(n):
+        r = sa[i]
+        if lms_map[r] == empty:
             continue
-        pleft = pos[r-1]  # r-1 is now valid
-        if pleft + lp < len(T):
-            while T[p+lp] == T[pleft + lp]:
-                lp += 1
-                
-                if (pleft + lp >= len(T)):
-                    break
-                    
-        lcp[r] = lp
+        if prev >= 0:
+            l = prev
+            end_l = lms[lms_map[l] + 1] if lms_map[l] + 1 < m else n
+            end_r = lms[lms_map[r] + 1] if lms_map[r] + 1 < m else n
+            same = end_l - l == end_r - r
+            if same:
+                while l < end_l and s[l] == s[r]:
+                    l += 1
+                    r += 1
+                same = l < n and s[l] == s[r]
+            if not same:
+                name += 1
+        rec[lms_map[sa[i]]] = name
+        prev = sa[i]
+    return name
+
+
+@njit(nogil=True)
+def _sais_sort_lms(lms, key, srt, ranks):
+    """
+    internal kernel that stores the LMS positions lms in suffix order into srt,
+    given their ranks (ranks=True) or the suffix array of the reduced string
+    """
+    for i in range(len(lms)):
+        if ranks:
+            srt[key[i]] = lms[i]
+        else:
+            srt[i] = lms[key[i]]
+
+
+def _sais(s, upper, sa, scratch=None, memory=0, level=0):
+    """
+    internal function that computes the suffix array of s (characters 0..upper) into sa;
+    if scratch is a directory, the temporary arrays beyond the first 'memory' bytes
+    are memory maps of files scratch/sais{level}_*.bin (removed when done)
+    """
+    n = len(s)
+    if n <= 1:
+        sa[:] = 0
+        return sa
+    files = []
+
+    def temporary(size, dtype, name):
+        nonlocal memory
+        nbytes = size * np.dtype(dtype).itemsize
+        if scratch is None or nbytes <= memory:
+            memory -= nbytes
+            return np.empty(size, dtype=dtype)
+        files.append(os.path.join(scratch, f"sais{level}_{name}.bin"))
+        return allocate(size, dtype, scratch, f"sais{level}_{name}")
+
+    empty = sa.dtype.type(np.iinfo(sa.dtype).max)
+    sum_l, sum_s, buf = (temporary(upper + 2, np.int64, name) for name in ("suml", "sums", "buf"))
+    ls = temporary(n, np.uint8, "ls")
+    m = _sais_buckets(s, ls, sum_l, sum_s)
+    lms, rec = temporary(m, sa.dtype, "lms"), temporary(m, sa.dtype, "rec")
+    lms_map = temporary(n, sa.dtype, "map")
+    name = _sais_reduce(s, ls, sum_l, sum_s, sa, buf, lms_map, lms, rec, empty)
+    del lms_map
+    if m > 0:
+        srt = temporary(m, sa.dtype, "sorted")  # the LMS positions in suffix order
+        if name + 1 == m:  # all names distinct: the names are the ranks
+            _sais_sort_lms(lms, rec, srt, True)
+        else:
+            order = _sais(rec, name, temporary(m, sa.dtype, "order"), scratch, memory, level + 1)
+            _sais_sort_lms(lms, order, srt, False)
+            del order
+        _sais_induce(s, ls, sum_l, sum_s, srt, sa, buf, empty)
+        del srt
+    del sum_l, sum_s, buf, ls, lms, rec
+    for f in files:
+        os.remove(f)
+    return sa
+
+
+def compute_pos_sais(T, scratch=None):
+    """
+    using SA-IS, in linear time, with numba kernels.
+    Returns the same array as compute_pos_manber_myers,
+    a memory map of scratch/pos.bin if a scratch directory is given.
+    """
+    T = np.frombuffer(T, dtype=np.uint8) if isinstance(T, (bytes, bytearray)) else T
+    return _sais(T, 255, allocate(len(T), index_dtype(len(T)), scratch, "pos"), scratch)
+
+
+@njit(nogil=True)
+def _lcp_phi(T, pos, lcp):
+    """
+    internal kernel that computes the lcp array of T into lcp (len(pos) + 1 entries)
+    without a rank array: the Phi algorithm (Kaerkkaeinen, Manzini and Puglisi, 2009)
+    stores the preceding suffix of each suffix and then its lcp (the PLCP array)
+    in text order in lcp itself, which is then permuted into rank order
+    in place along the cycles of pos (finished entries are stored as -1 - value)
+    """
+    n = len(pos)
+    lcp[n] = -1  # border sentinel
+    if n == 0:
+        return
+    for r in range(1, n):
+        lcp[pos[r]] = pos[r-1]
+    lcp[pos[0]] = -1  # the first suffix has no preceding one
+    lp = 0  # current common prefix length
+    for p in range(n):
+        q = lcp[p]
+        if q < 0:
+            lcp[p] = lp = 0  # moved to the border lcp[0] below
+            continue
+        while p + lp < len(T) and q + lp < len(T) and T[p+lp] == T[q+lp]:
+            lp += 1
+        lcp[p] = lp
         lp = lp - 1 if lp > 0 else 0  # next suffix: lose first character
+    for start in range(n):
+        if lcp[start] < 0:
+            continue
+        first = lcp[start]
+        r = start
+        while pos[r] != start:
+            lcp[r] = -1 - lcp[pos[r]]
+            r = pos[r]
+        lcp[r] = -1 - first
+    for r in range(n):
+        lcp[r] = -1 - lcp[r]
+    lcp[0] = -1  # border sentinel
 
+
+def compute_lcp(T, pos, scratch=None):
+    """
+    lcp array of T, in linear time and without a rank array,
+    as a memory map of scratch/lcp.bin if a scratch directory is given
+    """
+    T = np.frombuffer(T, dtype=np.uint8) if isinstance(T, (bytes, bytearray)) else T
+    lcp = allocate(len(pos) + 1, lcp_dtype(len(pos)), scratch, "lcp")
+    _lcp_phi(T, pos, lcp)
     return lcp
 
 
+# semi-external construction of pos and lcp for texts larger than RAM:
+# the text is a memory map, SA-IS writes pos into the memory-mapped file pos.bin
+# and holds its temporary arrays in RAM only up to the memory budget,
+# the rest are memory maps in the same directory; lcp is then computed
+# in place in the memory-mapped file lcp.bin (see _lcp_phi).
+# Both steps take linear time on any text, including long runs and repeats;
+# the memory maps are paged by the operating system.
+
+def compute_pos_lcp_external(T, directory, memory=1 << 30):
+    """
+    Semi-external construction of the suffix array and the lcp array of T
+    (a uint8 array, usually a memory map of a text file) that holds at most
+    about 'memory' bytes of temporary arrays in RAM, next to the memory maps.
+    Return memory maps of the files pos.bin and lcp.bin in directory,
+    of dtypes index_dtype(len(T)) and lcp_dtype(len(T)),
+    equal to compute_pos_sais(T) and compute_lcp(T, pos).
+    """
+    n = len(T)
+    pos = np.memmap(os.path.join(directory, "pos.bin"), dtype=index_dtype(n), mode="w+", shape=(max(n, 1),))[:n]
+    _sais(T, 255, pos, directory, memory)
+    lcp = compute_lcp(T, pos, directory)
+    pos.flush()
+    lcp.flush()
+    return pos, lcp
+
+
 def print_arrays(T, pos, lcp):
     for r in range(len(pos)):
         print(f"{pos[r]:2d}  {lcp[r]:2d}  {T[pos[r]:].decode('ASCII')}")
@@ -150,8 +537,49 @@ def count_mums(T, pos, lcp, n1, minlen=0, show=False):
     return nmum, lmum  # number and total length of MUMs
 
 
+def precompile():
+    """
+    Compile the kernels eagerly for the argument types used by main
+    (writable and read-only texts) into numba's on-disk cache,
+    for example once after installation.
+    """
+    _load_kernels()
+    from numba import typeof, types
+    u8, i32, i64 = (typeof(np.zeros(1, dtype=d)) for d in (np.uint8, np.int32, np.int64))
+    for text in (typeof(b""), u8, u8.copy(readonly=True)):
+        count_mums.compile((text, i32, i32, types.int64, types.int64, types.boolean))
+    for text in (u8, u8.copy(readonly=True)):
+        _lcp_phi.compile((text, i32, i32))
+        for s in (text, i32):  # the text, and the reduced strings of the recursion
+            _sais_buckets.compile((s, u8, i64, i64))
+            _sais_reduce.compile((s, u8, i64, i64, i32, i64, i32, i32, i32, types.int32))
+            _sais_induce.compile((s, u8, i64, i64, i32, i32, i64, types.int32))
+    _sais_sort_lms.compile((i32, i32, i32, types.boolean))
+
+
+def parse_size(s):
+    """number of bytes given as an integer with an optional suffix K, M, G or T (powers of 1024)"""
+    s = s.strip().upper()
+    factor = 1024 ** ("KMGT".index(s[-1]) + 1) if s and s[-1] in "KMGT" else 1
+    return int(float(s[:-1] if factor > 1 else s) * factor)
+
+
+class _PrecompileAction(Action):
+    """argparse action that runs precompile() and exits, without further arguments (like --version)"""
+
+    def __init__(self, option_strings, dest, help=None):
+        super().__init__(option_strings, dest, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        precompile()
+        parser.exit()
+
+
 def get_argument_parser():
     p = ArgumentParser(description="finds all Maximal Unique Matches (MUMs) between two genomes")
+    p.add_argument("--precompile", action=_PrecompileAction,
+        help="compile all kernels into numba's on-disk cache and exit "
+            "(once after installation, so that the first run starts fast)")
     p.add_argument("fasta1",
         help="name of first FASTA file: first genome")
     p.add_argument("fasta2",
@@ -160,23 +588,59 @@ def get_argument_parser():
         help="minimum length of MUMs to consider (default=0; use >= 16 for bacterial genomes)")
     p.add_argument("--show", action="store_true",
         help="print MUMs to stdout")
+    p.add_argument("--suffix-array", "-s", choices=("sais", "manber-myers"), default="sais",
+        help="suffix array construction: 'sais' (linear time, default) or 'manber-myers'")
+    p.add_argument("--scratch", metavar="DIR",
+        help="allocate the suffix and lcp arrays, and the temporary arrays of SA-IS, "
+            "as memory maps of files in DIR (pos.bin, lcp.bin; with '-s sais') instead of in RAM")
+    p.add_argument("--external", metavar="DIR",
+        help="build the suffix and lcp arrays semi-externally in bounded memory (see --memory); "
+            "the text and the memory-mapped arrays (text.bin, pos.bin, lcp.bin, "
+            "and temporary arrays of SA-IS) are written to DIR")
+    p.add_argument("--memory", type=parse_size, default="1G",
+        help="memory for temporary arrays held in RAM with --external, like 512M or 8G [1G]")
+    p.add_argument("--genome-cache", action="store_true",
+        help="convert the FASTA files into binary caches (FASTA.seq, FASTA.idx.npz) "
+            "if they have none; up-to-date caches are always used")
     return p
 
 
 def main(args):
-    print(f"# Reading '{args.fasta1}'...")
-    T = make_genome_text(args.fasta1, sep=ord("&"), end=ord("$"))
-    print(f"# Reading '{args.fasta2}'...")
-    S = make_genome_text(args.fasta2, sep=ord("%"), end=ord("#"))
-    n1, n2 = len(T), len(S)  # lengths of the individual genomes
-    T = bytes(T+S)
+    if args.genome_cache:
+        for fasta in (args.fasta1, args.fasta2):
+            if load_genome_cache(fasta) is None:
+                print(f"# Caching '{fasta}'...")
+                make_genome_cache(fasta)
+    if args.external is not None:
+        os.makedirs(args.external, exist_ok=True)
+        textname = os.path.join(args.external, "text.bin")
+        with open(textname, "wb") as f:
+            print(f"# Reading '{args.fasta1}'...")
+            n1 = write_genome_text(args.fasta1, f, sep=ord("&"), end=ord("$"))
+            print(f"# Reading '{args.fasta2}'...")
+            n2 = write_genome_text(args.fasta2, f, sep=ord("%"), end=ord("#"))
+        T = np.asarray(np.memmap(textname, dtype=np.uint8, mode="r"))
+    else:
+        print(f"# Reading '{args.fasta1}'...")
+        T = make_genome_text(args.fasta1, sep=ord("&"), end=ord("$"))
+        print(f"# Reading '{args.fasta2}'...")
+        S = make_genome_text(args.fasta2, sep=ord("%"), end=ord("#"))
+        n1, n2 = len(T), len(S)  # lengths of the individual genomes
+        T = bytes(T+S)
     n = len(T)
     print(f"# Genome lengths: {n1} + {n2} = {n}")
-    print(f"# Computing suffix array...")
-    pos = compute_pos_manber_myers(T)
-    print(f"# Computing lcp array...")
-    lcp = compute_lcp(T, pos)
-    if n <= 50: print_arrays(T, pos, lcp)  # only actually prints short texts
+    if args.external is not None:
+        print(f"# Computing suffix and lcp arrays in '{args.external}'...")
+        pos, lcp = compute_pos_lcp_external(T, args.external, args.memory)
+    else:
+        print(f"# Computing suffix array...")
+        if args.suffix_array == "sais":
+            pos = compute_pos_sais(T, args.scratch)
+        else:
+            pos = compute_pos_manber_myers(T)
+        print(f"# Computing lcp array...")
+        lcp = compute_lcp(T, pos, args.scratch)
+    if n <= 50: print_arrays(bytes(T), pos, lcp)  # only actually prints short texts
 
     # search for MUMs and count / print them
     print(f"# Looking for MUMs...")
@@ -1,4 +1,12 @@
-from MUM import count_mums, compute_pos_manber_myers, compute_lcp
+from MUM import count_mums, compute_pos_manber_myers, compute_lcp, compute_pos_sais
+from MUM import make_genome_text, make_genome_cache, write_genome_text
+from MUM import compute_pos_lcp_external
+from MUM import index_dtype, lcp_dtype, _sais
+from MUM import precompile, _lcp_phi, _sais_induce
+import os
+import tracemalloc
+import numpy as np
+
 def test_mum():
     T = b"miississippii"
     S = b"mississippi"
@@ -10,3 +18,98 @@ def test_mum():
     nmums, length = count_mums(T, pos, lcp, n1, minlen=0, show=False)
     assert nmums == 2
     assert length == 12
+
+
+def test_make_genome_text_cached(tmp_path):
+    fasta = tmp_path / "g.fa"
+    fasta.write_bytes(b">a\nmiss\nissippii\n>b\n\n>c\nmississippi\n")
+    expected = make_genome_text(str(fasta))
+    assert expected == bytearray(b"mississippii&&mississippi&$")
+    make_genome_cache(str(fasta))
+    assert make_genome_text(str(fasta)) == expected
+
+
+def test_write_genome_text(tmp_path):
+    fasta = tmp_path / "g.fa"
+    fasta.write_bytes(b">a\nmiss\nissippii\n>b\n\n>c\nmississippi\n>d\nACGT\n")
+    expected = make_genome_text(str(fasta), sep=ord("%"), end=ord("#"))
+    for cached in (False, True):
+        if cached:
+            make_genome_cache(str(fasta))
+        with open(tmp_path / "text.bin", "wb") as f:
+            n = write_genome_text(str(fasta), f, sep=ord("%"), end=ord("#"))
+        assert (tmp_path / "text.bin").read_bytes() == expected
+        assert n == len(expected)
+
+
+def test_sais():
+    rng = np.random.default_rng(0)
+    texts = [b"", b"a", b"mississippii&&mississippi&$", b"ACGT" * 50 + b"$", b"A" * 100]
+    texts += [bytes(rng.choice(np.frombuffer(b"ab$", dtype=np.uint8), size=n)) for n in range(2, 200, 7)]
+    for T in texts:
+        pos = compute_pos_sais(T)
+        assert pos.dtype == np.int32
+        assert pos.tolist() == sorted(range(len(T)), key=lambda p: T[p:])
+        assert pos.tolist() == compute_pos_manber_myers(T).tolist()
+
+
+
+def test_external(tmp_path):
+    rng = np.random.default_rng(1)
+    for T in (b"miississippii&$mississippi%#", bytes(rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=3000)) + b"#"):
+        pos = compute_pos_sais(T)
+        lcp = compute_lcp(T, pos)
+        for memory in (0, 1 << 20):  # temporary arrays in scratch files, in RAM
+            epos, elcp = compute_pos_lcp_external(np.frombuffer(T, dtype=np.uint8), str(tmp_path), memory)
+            assert epos.tolist() == pos.tolist()
+            assert elcp.tolist() == lcp.tolist()
+    T = np.frombuffer(b"miississippii&$mississippi%#", dtype=np.uint8)
+    pos, lcp = compute_pos_lcp_external(T, str(tmp_path), 64)
+    assert count_mums(T, pos, lcp, 15) == (2, 12)
+
+
+def test_external_repeats(tmp_path):
+    rng = np.random.default_rng(2)
+    random = lambda size: bytes(rng.choice(np.frombuffer(b"ACGT", dtype=np.uint8), size=size))
+    # an assembly gap and a period-2 repeat (quadratic for character comparisons)
+    T = random(1000) + b"N" * 200_000 + random(1000) + b"AC" * 100_000 + random(1000) + b"&$"
+    pos = compute_pos_sais(T)
+    lcp = compute_lcp(T, pos)
+    tracemalloc.start()
+    epos, elcp = compute_pos_lcp_external(np.frombuffer(T, dtype=np.uint8), str(tmp_path), 1 << 16)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < (1 << 16) + (1 << 14)  # the budget, not the 400k entries of the temporary arrays
+    assert np.array_equal(epos, pos) and np.array_equal(elcp, lcp)
+    assert sorted(os.listdir(tmp_path)) == ["lcp.bin", "pos.bin"]
+
+
+def test_index_dtypes(tmp_path):
+    assert index_dtype(2**31 - 1) == np.int32 and lcp_dtype(2**31 - 1) == np.int32
+    assert index_dtype(2**32 - 1) == np.uint32 and lcp_dtype(2**32 - 1) == np.int64
+    assert index_dtype(2**32) == np.int64  # 2**32 - 1 is a position, so it cannot mark empty entries
+    T = b"miississippii&$mississippi%#"
+    s = np.frombuffer(T, dtype=np.uint8)
+    pos = compute_pos_sais(T)
+    for dtype in (np.uint32, np.int64):  # the dtypes of larger texts
+        assert _sais(s, 255, np.empty(len(s), dtype=dtype)).tolist() == pos.tolist()
+    # lcp without a rank array, in scratch files
+    for R in (b"ACACGACACGTACACGACACGT" * 20 + b"$", T):  # with and without recursion
+        pos = compute_pos_sais(R, str(tmp_path))
+        assert pos.tolist() == compute_pos_manber_myers(R).tolist()
+        assert os.listdir(tmp_path) == ["pos.bin"]  # the scratch arrays of SA-IS are removed
+    lcp = compute_lcp(T, pos, str(tmp_path))
+    assert isinstance(pos, np.memmap) and isinstance(lcp, np.memmap)
+    common = lambda p, q: next(i for i in range(len(T)) if q + i == len(T) or T[p+i] != T[q+i])
+    assert lcp.tolist() == [-1] + [common(pos[r-1], pos[r]) for r in range(1, len(T))] + [-1]
+
+
+def test_precompile():
+    precompile()
+    T = b"miississippii&$mississippi%#"
+    kernels = (_lcp_phi.dispatcher, _sais_induce.dispatcher, count_mums.dispatcher)
+    compiled = [len(k.signatures) for k in kernels]
+    pos = compute_pos_sais(T)  # as main calls the kernels
+    lcp = compute_lcp(T, pos)
+    assert count_mums(T, pos, lcp, 15, minlen=0, show=False) == (2, 12)
+    assert [len(k.signatures) for k in kernels] == compiled  # nothing compiled lazily